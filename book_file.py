@@ -0,0 +1,64 @@
+"""定石ファイルの読み書き（オセロ・コネクトフォー共通）
+
+ファイルはマジック（形式を表すバイト列）に続けて、
+「キー（固定長・ビッグエンディアン）+ 1 バイトの手」のレコードをキー順に並べたもの。
+読むときは mmap して二分探索する。キーの作り方は各ゲームの AI が決める。
+"""
+
+import mmap
+
+
+class BookFile:
+    def __init__(self, path, magic, key_bytes):
+        with open(path, "rb") as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.data[:len(magic)] != magic:
+            raise ValueError(f"定石ファイルの形式が違います: {path}")
+        self.key_bytes = key_bytes
+        self.record = key_bytes + 1
+        self.offset = len(magic)
+        self.count = (len(self.data) - self.offset) // self.record
+
+    def __len__(self):
+        return self.count
+
+    def find(self, key):
+        """key のレコードの手（なければ None）"""
+        target = key.to_bytes(self.key_bytes, "big")
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = self.offset + mid * self.record
+            probe = self.data[pos:pos + self.key_bytes]
+            if probe < target:
+                lo = mid + 1
+            elif probe > target:
+                hi = mid
+            else:
+                return self.data[pos + self.key_bytes]
+        return None
+
+
+def write_book(path, magic, key_bytes, records):
+    """(キー, 手) の組をキー順に並べて書き出し、書いた件数を返す"""
+    records = sorted(records)
+    with open(path, "wb") as f:
+        f.write(magic)
+        for key, move in records:
+            f.write(key.to_bytes(key_bytes, "big"))
+            f.write(bytes([move]))
+    return len(records)
+
+
+class LazyBook:
+    """定石ファイルを（あれば）最初に使うときに一度だけ開く"""
+
+    def __init__(self, path, opener):
+        self.path = path
+        self.opener = opener
+        self.book = None
+
+    def get(self):
+        if self.book is None:
+            self.book = self.opener(self.path) if self.path.exists() else False
+        return self.book or None
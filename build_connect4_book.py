@@ -0,0 +1,72 @@
+"""コネクトフォーの定石データベースを作るオフラインツール
+
+初期局面から --plies 手目までに現れる局面をすべて列挙し、
+それぞれの最善の列を探索して connect4_ai.OpeningBook 形式のファイルに書き出す。
+
+    python build_connect4_book.py --plies 6 --depth 16 --time-ms 5000 --out connect4_book.bin
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from book_file import write_book
+from connect4_ai import (
+    BOOK_KEY_BYTES, BOOK_MAGIC, BOOK_PATH, book_key, choose_column, is_winning_move, play,
+)
+from connect4_board import COLS, top_mask
+
+
+def enumerate_positions(plies):
+    """{キー: (current, mask, 手数)} を返す（勝負がついた局面は含めない）"""
+    frontier = {book_key(0, 0): (0, 0, 0)}
+    positions = dict(frontier)
+    for _ in range(plies):
+        next_frontier = {}
+        for current, mask, moves in frontier.values():
+            for col in range(COLS):
+                if mask & top_mask(col) or is_winning_move(current, mask, col):
+                    continue
+                child = play(current, mask, col) + (moves + 1,)
+                key = book_key(child[0], child[1])
+                if key not in positions:
+                    positions[key] = child
+                    next_frontier[key] = child
+        frontier = next_frontier
+    return positions
+
+
+def best_column(args):
+    key, current, mask, moves, depth, time_ms = args
+    return key, choose_column(current, mask, moves, depth, time_ms, use_book=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="コネクトフォーの定石データベースを作成します")
+    parser.add_argument("--plies", type=int, default=4, help="初期局面から何手目まで収録するか")
+    parser.add_argument("--depth", type=int, default=16, help="各局面の最大探索深さ")
+    parser.add_argument("--time-ms", type=int, default=3000, help="各局面の思考時間（ミリ秒）")
+    parser.add_argument("--workers", type=int, default=None, help="並列に探索するプロセス数")
+    parser.add_argument("--out", default=str(BOOK_PATH), help="出力ファイル")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    positions = enumerate_positions(args.plies)
+    print(f"{len(positions)} 局面を探索します...")
+
+    jobs = [(key, current, mask, moves, args.depth, args.time_ms)
+            for key, (current, mask, moves) in positions.items()]
+    records = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for key, col in executor.map(best_column, jobs, chunksize=16):
+            if col is not None:
+                records.append((key, col))
+
+    write_book(args.out, BOOK_MAGIC, BOOK_KEY_BYTES, records)
+
+    elapsed = time.perf_counter() - started
+    print(f"{len(records)} 件を {args.out} に書き出しました（{elapsed:.1f} 秒）")
+
+
+if __name__ == "__main__":
+    main()
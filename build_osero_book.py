@@ -0,0 +1,85 @@
+"""オセロ（6x6）の定石ブックを作るオフラインツール
+
+初期局面から --plies 手目までに現れる局面をすべて列挙し、
+それぞれの最善手を探索して osero_ai.OpeningBook 形式のファイルに書き出す。
+
+    python build_osero_book.py --plies 8 --depth 8 --time-ms 2000 --out osero_book.bin
+"""
+
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from book_file import write_book
+from osero_ai import (
+    BOOK_KEY_BYTES, BOOK_MAGIC, ENDGAME_EMPTIES, BOOK_PATH,
+    apply_move, canonical, choose_move, solve_endgame, transform,
+)
+from osero_board import BLACK, CELLS, OseroBoard, iter_bits, legal_mask, popcount
+
+
+def enumerate_positions(plies):
+    """手番側から見た正規化済み局面 {キー: (自分, 相手)} を返す"""
+    own, opp = OseroBoard.initial().bits(BLACK)
+    key, table = canonical(own, opp)
+    frontier = {key: (transform(own, table), transform(opp, table))}
+    positions = dict(frontier)
+    for _ in range(plies):
+        next_frontier = {}
+        for own, opp in frontier.values():
+            legal = legal_mask(own, opp)
+            if not legal:
+                # パスは手数に数えず、相手の手番として展開し直す
+                if legal_mask(opp, own):
+                    legal = legal_mask(opp, own)
+                    own, opp = opp, own
+                else:
+                    continue
+            for index in iter_bits(legal):
+                next_own, next_opp = apply_move(own, opp, index)
+                key, table = canonical(next_opp, next_own)
+                if key not in positions:
+                    child = (transform(next_opp, table), transform(next_own, table))
+                    positions[key] = child
+                    next_frontier[key] = child
+        frontier = next_frontier
+    return positions
+
+
+def best_move(args):
+    key, own, opp, depth, time_ms = args
+    if not legal_mask(own, opp):
+        return key, None
+    if CELLS - popcount(own | opp) <= ENDGAME_EMPTIES:
+        return key, solve_endgame(own, opp)[0]
+    return key, choose_move(own, opp, 0, 0, depth, time_ms, use_book=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="オセロの定石ブックを作成します")
+    parser.add_argument("--plies", type=int, default=6, help="初期局面から何手目まで収録するか")
+    parser.add_argument("--depth", type=int, default=8, help="各局面の最大探索深さ")
+    parser.add_argument("--time-ms", type=int, default=2000, help="各局面の思考時間（ミリ秒）")
+    parser.add_argument("--workers", type=int, default=None, help="並列に探索するプロセス数")
+    parser.add_argument("--out", default=str(BOOK_PATH), help="出力ファイル")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    positions = enumerate_positions(args.plies)
+    print(f"{len(positions)} 局面を探索します...")
+
+    jobs = [(key, own, opp, args.depth, args.time_ms) for key, (own, opp) in positions.items()]
+    records = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for key, move in executor.map(best_move, jobs, chunksize=16):
+            if move is not None:
+                records.append((key, move))
+
+    write_book(args.out, BOOK_MAGIC, BOOK_KEY_BYTES, records)
+
+    elapsed = time.perf_counter() - started
+    print(f"{len(records)} 件を {args.out} に書き出しました（{elapsed:.1f} 秒）")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""コネクトフォー Bot の思考エンジン
+
+手番側の石 current と両者の石 mask の 2 つの整数だけで局面を表し、
+negamax + αβ 枝刈り、中央優先の手順、置換表、反復深化で探索する。
+定石データベース（build_connect4_book.py で作成）があれば序盤はそれを引く。
+ワーカープロセス上で呼ばれる前提なので、引数と戻り値は整数だけにしている。
+"""
+
+import os
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from book_file import BookFile, LazyBook
+from connect4_board import (
+    BOARD_MASK, BOTTOM_MASK, COLS, HEIGHT, ROWS,
+    bottom_mask, column_mask, has_four, top_mask,
+)
+
+Level = namedtuple("Level", ["max_depth", "time_ms"])
+
+CELLS = COLS * ROWS
+
+# 強さの設定（最大探索深さ, 1 手あたりの思考時間）
+LEVELS = {
+    "easy": Level(2, 100),
+    "normal": Level(8, 300),
+    "hard": Level(CELLS, 1500),
+}
+DEFAULT_LEVEL = "normal"
+
+# 中央の列から順に調べる
+ORDER = sorted(range(COLS), key=lambda col: abs(COLS // 2 - col))
+
+WIN_SCORE = 1000
+INF = WIN_SCORE * 10
+
+EXACT, LOWER, UPPER = 0, 1, 2
+TT_LIMIT = 500000
+
+# ワーカーごとに持ち続ける置換表: key -> (深さ, 評価値, 種別, 最善手)
+_table = {}
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def play(current, mask, col):
+    """col に打った後の（相手から見た）(current, mask) を返す"""
+    return current ^ mask, mask | (mask + bottom_mask(col))
+
+
+def is_winning_move(current, mask, col):
+    stone = (mask + bottom_mask(col)) & column_mask(col)
+    return has_four(current | stone)
+
+
+def winning_cells(position, mask):
+    """あと 1 つで 4 つ並ぶ空きマス"""
+    cells = (position << 1) & (position << 2) & (position << 3)
+    for shift in (HEIGHT, HEIGHT - 1, HEIGHT + 1):
+        pair = (position << shift) & (position << 2 * shift)
+        cells |= pair & (position << 3 * shift)
+        cells |= pair & (position >> shift)
+        pair = (position >> shift) & (position >> 2 * shift)
+        cells |= pair & (position << shift)
+        cells |= pair & (position >> 3 * shift)
+    return cells & (BOARD_MASK ^ mask)
+
+
+def evaluate(current, mask):
+    opponent = current ^ mask
+    return (winning_cells(current, mask).bit_count()
+            - winning_cells(opponent, mask).bit_count())
+
+
+def win_score(moves):
+    # 早く勝つほど高い
+    return WIN_SCORE + (CELLS + 1 - moves) // 2
+
+
+class Searcher:
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.nodes = 0
+
+    def negamax(self, current, mask, moves, depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes & 1023 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        if moves >= CELLS:
+            return 0
+        playable = [col for col in ORDER if not mask & top_mask(col)]
+        for col in playable:
+            if is_winning_move(current, mask, col):
+                return win_score(moves + 1)
+        if moves + 1 >= CELLS:
+            return 0
+        if depth == 0:
+            return evaluate(current, mask)
+
+        key = current + mask
+        entry = _table.get(key)
+        hint = None
+        if entry is not None:
+            entry_depth, value, flag, hint = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                elif flag == UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+            if hint in playable:
+                playable.remove(hint)
+                playable.insert(0, hint)
+
+        alpha_orig = alpha
+        best = -INF
+        best_move = None
+        for col in playable:
+            next_current, next_mask = play(current, mask, col)
+            value = -self.negamax(next_current, next_mask, moves + 1, depth - 1, -beta, -alpha)
+            if value > best:
+                best = value
+                best_move = col
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best <= alpha_orig:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        if len(_table) >= TT_LIMIT:
+            _table.clear()
+        _table[key] = (depth, best, flag, best_move)
+        return best
+
+    def root(self, current, mask, moves, depth, hint):
+        playable = [col for col in ORDER if not mask & top_mask(col)]
+        if hint in playable:
+            playable.remove(hint)
+            playable.insert(0, hint)
+        alpha = -INF
+        best_move = None
+        for col in playable:
+            if is_winning_move(current, mask, col):
+                return col, win_score(moves + 1)
+            next_current, next_mask = play(current, mask, col)
+            value = -self.negamax(next_current, next_mask, moves + 1, depth - 1, -INF, -alpha)
+            if value > alpha or best_move is None:
+                alpha = value
+                best_move = col
+        return best_move, alpha
+
+
+# ── 定石データベース ─────────────────────────────
+
+BOOK_MAGIC = b"C4BK1\n"
+BOOK_KEY_BYTES = (COLS * HEIGHT + 7) // 8
+
+
+def book_key(current, mask):
+    """局面を一意に表すキー（current + mask + 各列の底）"""
+    return current + mask + BOTTOM_MASK
+
+
+class OpeningBook(BookFile):
+    """build_connect4_book.py が作るファイル"""
+
+    def __init__(self, path):
+        super().__init__(path, BOOK_MAGIC, BOOK_KEY_BYTES)
+
+    def lookup(self, current, mask):
+        return self.find(book_key(current, mask))
+
+
+BOOK_PATH = Path(os.getenv("CONNECT4_BOOK_PATH", Path(__file__).resolve().parent / "connect4_book.bin"))
+_book = LazyBook(BOOK_PATH, OpeningBook)
+
+
+def get_book():
+    """定石データベースを（あれば）一度だけ開く"""
+    return _book.get()
+
+
+def choose_column(current, mask, moves, max_depth=8, time_ms=300, use_book=True):
+    """
+    手番側の石 current・両者の石 mask から打つ列（0 始まり）を返す。打てなければ None。
+    time_ms を過ぎたら、最後に読み切った深さの最善手を返す。
+    """
+    if moves >= CELLS:
+        return None
+
+    if use_book:
+        book = get_book()
+        if book is not None:
+            col = book.lookup(current, mask)
+            if col is not None:
+                return col
+
+    searcher = Searcher(time.perf_counter() + time_ms / 1000)
+    best_move = None
+    for depth in range(1, min(max_depth, CELLS - moves) + 1):
+        try:
+            best_move, score = searcher.root(current, mask, moves, depth, best_move)
+        except SearchTimeout:
+            break
+        # 勝ち負けが読み切れたらそれ以上深く読まない
+        if abs(score) >= WIN_SCORE:
+            break
+    if best_move is None:
+        best_move = next(col for col in ORDER if not mask & top_mask(col))
+    return best_move
@@ -0,0 +1,95 @@
+"""コネクトフォー盤面のビットボード実装
+
+列ごとに (ROWS + 1) ビットを下から順に使う（一番上の 1 ビットは番兵）。
+マス (列 c, 下から r 段目) はビット c * (ROWS + 1) + r に対応する。
+プレイヤーごとの石と、両者を合わせた mask、各列の次に置くビット位置を持つ。
+"""
+
+COLS = 7
+ROWS = 6
+HEIGHT = ROWS + 1
+
+# 各列の一番下のビット
+BOTTOM_MASK = sum(1 << (col * HEIGHT) for col in range(COLS))
+# 番兵を除いた盤面全体
+BOARD_MASK = BOTTOM_MASK * ((1 << ROWS) - 1)
+
+# 縦・横・斜め2方向のシフト量
+WIN_SHIFTS = (1, HEIGHT, HEIGHT - 1, HEIGHT + 1)
+
+
+def column_mask(col):
+    return ((1 << ROWS) - 1) << (col * HEIGHT)
+
+
+def bottom_mask(col):
+    return 1 << (col * HEIGHT)
+
+
+def top_mask(col):
+    return 1 << (ROWS - 1 + col * HEIGHT)
+
+
+def has_four(bits):
+    """4 つ並んだ石があるか（シフトだけで判定）"""
+    for shift in WIN_SHIFTS:
+        pairs = bits & (bits >> shift)
+        if pairs & (pairs >> (2 * shift)):
+            return True
+    return False
+
+
+class Connect4Board:
+    __slots__ = ("boards", "mask", "heights", "moves")
+
+    def __init__(self):
+        self.boards = [0, 0]
+        self.mask = 0
+        # 各列で次に石が入るビット位置
+        self.heights = [col * HEIGHT for col in range(COLS)]
+        self.moves = 0
+
+    @classmethod
+    def from_moves(cls, columns):
+        """列番号（0 始まり）の並びを先手から交互に打った盤面を返す（棋譜の再生用）"""
+        board = cls()
+        for col in columns:
+            if not board.can_play(col):
+                raise ValueError(f"{col} 列目はすでに埋まっています")
+            board.play(col, board.moves % 2)
+        return board
+
+    def copy(self):
+        board = Connect4Board.__new__(Connect4Board)
+        board.boards = self.boards[:]
+        board.mask = self.mask
+        board.heights = self.heights[:]
+        board.moves = self.moves
+        return board
+
+    def can_play(self, col):
+        return not self.mask & top_mask(col)
+
+    def is_full(self):
+        return self.moves >= COLS * ROWS
+
+    def play(self, col, player):
+        """player の石を col 列に落とし、入った段（上から数えた行番号）を返す"""
+        bit = 1 << self.heights[col]
+        self.boards[player] |= bit
+        self.mask |= bit
+        self.heights[col] += 1
+        self.moves += 1
+        return ROWS - (self.heights[col] - col * HEIGHT)
+
+    def cell(self, row, col):
+        """上から row 行目・col 列目の石のプレイヤー番号（空なら None）"""
+        bit = 1 << (col * HEIGHT + ROWS - 1 - row)
+        if self.boards[0] & bit:
+            return 0
+        if self.boards[1] & bit:
+            return 1
+        return None
+
+    def is_win(self, player):
+        return has_four(self.boards[player])
@@ -3,6 +3,16 @@ from discord.ext import commands
 import os
 from dotenv import load_dotenv
 import random
+import asyncio
+import re
+import struct
+from typing import Optional
+from connect4_ai import DEFAULT_LEVEL, LEVELS, choose_column, get_book
+from connect4_board import Connect4Board, ROWS
+from worker_pool import search_pool
+from game_store import SavedGames, get_store, key_channel_id, resolve_user
+from session_registry import IDLE_TIMEOUT, sessions
+from message_router import route_message, router
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -16,63 +26,157 @@ EMOJIS = {
 }
 
 COLUMNS = ['A', 'B', 'C', 'D', 'E', 'F', 'G']
-ROWS = 6
+# 列の入力（前後の空白と大文字・小文字は問わない）
+MOVE_PATTERN = re.compile(r"\s*([A-G])\s*", re.IGNORECASE)
+
+# プレイヤー番号 → EMOJIS のキー
+CELL_NAMES = {None: "empty", 0: "red", 1: "blue"}
+
+FOOTER = (
+        "<:A_:1385608608913293322>"
+        "<:B_:1385608616064712917>"
+        "<:C_:1385608624818356325>"
+        "<:D_:1385608635476082819>"
+        "<:E_:1385608646372622457>"
+        "<:F_:1385608657747574876>"
+        "<:G_:1385608684683399250>"
+)
+
+# 1 つの盤面メッセージを編集し続けるか（新しいメッセージを送らない）
+EDIT_BOARD_MESSAGE = os.getenv("CONNECT4_EDIT_BOARD", "0") == "1"
+# 連続した更新をまとめる時間（秒）
+EDIT_WINDOW = float(os.getenv("CONNECT4_EDIT_WINDOW", "0.5"))
 
 games = {}
 
 class Connect4Game:
-    def __init__(self, player1, player2):
-        self.board = [['empty' for _ in range(7)] for _ in range(ROWS)]
+    def __init__(self, player1, player2, level=DEFAULT_LEVEL):
+        self.board = Connect4Board()
+        self.history = bytearray()  # 落とした列の並び（保存と再開用）
         self.players = [player1, player2]
         random.shuffle(self.players)
         self.current = 0
         self.winner = None
         self.active = True
+        self.level = level  # Bot と対戦するときの強さ
+        self.rows = [None] * ROWS  # 行ごとの表示文字列のキャッシュ
+        self.board_message = None  # EDIT_BOARD_MESSAGE 時に編集し続けるメッセージ
 
     def place_piece(self, column_letter):
         if column_letter not in COLUMNS:
             return False, "無効な列でございますわ。"
 
         col = COLUMNS.index(column_letter)
-        for row in reversed(range(ROWS)):
-            if self.board[row][col] == 'empty':
-                self.board[row][col] = 'red' if self.current == 0 else 'blue'
-                if self.check_win(row, col):
-                    self.winner = self.players[self.current]
-                    self.active = False
-                else:
-                    self.current = 1 - self.current
-                return True, None
-        return False, "この列はすでに埋まっておりますわ。"
+        if not self.board.can_play(col):
+            return False, "この列はすでに埋まっておりますわ。"
+
+        row = self.board.play(col, self.current)
+        self.history.append(col)
+        self.rows[row] = None  # 石が入った行だけ作り直す
+        if self.check_win(row, col):
+            self.winner = self.players[self.current]
+            self.active = False
+        else:
+            self.current = 1 - self.current
+        return True, None
 
     def check_win(self, r, c):
-        color = self.board[r][c]
-        directions = [(1,0), (0,1), (1,1), (1,-1)]
-        for dr, dc in directions:
-            count = 1
-            for d in [-1, 1]:
-                for i in range(1, 4):
-                    nr, nc = r + dr*i*d, c + dc*i*d
-                    if 0 <= nr < ROWS and 0 <= nc < 7 and self.board[nr][nc] == color:
-                        count += 1
-                    else:
-                        break
-            if count >= 4:
-                return True
-        return False
+        player = self.board.cell(r, c)
+        return player is not None and self.board.is_win(player)
+
+    def get_row_display(self, row):
+        text = self.rows[row]
+        if text is None:
+            text = ''.join(EMOJIS[CELL_NAMES[self.board.cell(row, col)]] for col in range(len(COLUMNS)))
+            self.rows[row] = text
+        return text
 
     def get_board_display(self):
-        board_str = '\n'.join(''.join(EMOJIS[cell] for cell in row) for row in self.board)
-        footer = (
-                "<:A_:1385608608913293322>"
-                "<:B_:1385608616064712917>"
-                "<:C_:1385608624818356325>"
-                "<:D_:1385608635476082819>"
-                "<:E_:1385608646372622457>"
-                "<:F_:1385608657747574876>"
-                "<:G_:1385608684683399250>"
-        )
-        return f"{board_str}\n{footer}"
+        board_str = '\n'.join(self.get_row_display(row) for row in range(ROWS))
+        return f"{board_str}\n{FOOTER}"
+
+
+# 進行中の対局のスナップショット: 先手・後手の ID と強さ、続けて落とした列の並び
+STATE_KIND = "connect4"
+SNAPSHOT_HEADER = struct.Struct("<QQB")
+
+def pack_game(game):
+    header = SNAPSHOT_HEADER.pack(game.players[0].id, game.players[1].id, list(LEVELS).index(game.level))
+    return header + bytes(game.history)
+
+async def unpack_game(data):
+    p1, p2, level = SNAPSHOT_HEADER.unpack_from(data)
+    history = data[SNAPSHOT_HEADER.size:]
+    players = [await resolve_user(bot, p1), await resolve_user(bot, p2)]
+    game = Connect4Game(*players, list(LEVELS)[level])
+    game.players = players  # 保存したときの先手・後手に戻す
+    game.board = Connect4Board.from_moves(history)
+    game.history = bytearray(history)
+    game.current = len(history) % 2
+    return game
+
+def save_game(channel_id, game):
+    get_store().put(STATE_KIND, channel_id, pack_game(game))
+    sessions.touch(STATE_KIND, channel_id, IDLE_TIMEOUT, expire_game)
+
+def drop_game(channel_id):
+    game = games.pop(channel_id, None)
+    router.discard(channel_id, STATE_KIND)
+    get_store().delete(STATE_KIND, channel_id)
+    sessions.remove(STATE_KIND, channel_id)
+    return game
+
+async def expire_game(channel_id):
+    """しばらく操作のなかったゲームを片付ける"""
+    game = drop_game(channel_id)
+    if game and game.board_message:
+        await game.board_message.close()
+    channel = bot.get_channel(channel_id)
+    if channel:
+        await channel.send("しばらくお手が進みませんでしたので、ゲームを終了いたしましたわ。")
+
+class BoardMessage:
+    """
+    1 つの盤面メッセージを編集し続ける。
+    window 秒以内の連続した更新は、最後の内容だけを 1 回の編集で反映する。
+    """
+
+    def __init__(self, channel, window=EDIT_WINDOW):
+        self.channel = channel
+        self.window = window
+        self.message = None
+        self.pending = None
+        self.flush_task = None
+        self.lock = asyncio.Lock()
+
+    async def update(self, content):
+        self.pending = content
+        if self.message is None:
+            await self.flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self.flush_later())
+
+    async def flush_later(self):
+        await asyncio.sleep(self.window)
+        self.flush_task = None
+        await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            content, self.pending = self.pending, None
+            if content is None:
+                return
+            if self.message is None:
+                self.message = await self.channel.send(content)
+            else:
+                await self.message.edit(content=content)
+
+    async def close(self):
+        """待っている更新をすぐに反映する"""
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
 
 
 class JoinView(discord.ui.View):
@@ -89,12 +193,68 @@ class JoinView(discord.ui.View):
         self.opponent = interaction.user
         self.stop()
 
+async def show_board(channel, game, content, final=False):
+    if not EDIT_BOARD_MESSAGE:
+        await channel.send(content)
+        return
+    if game.board_message is None:
+        game.board_message = BoardMessage(channel)
+    await game.board_message.update(content)
+    if final:
+        await game.board_message.close()
+
+async def start_game(channel, game):
+    router.add(channel.id, STATE_KIND, handle_message)
+    save_game(channel.id, game)
+    await show_board(channel, game, f"{game.players[0].mention} vs {game.players[1].mention} ゲーム開始ですわ！\n{game.players[game.current].mention} が先攻ですわ。\n{game.get_board_display()}")
+    if game.players[game.current] == bot.user:
+        await play_bot_move(channel, game)
+
+async def announce_move(channel, game):
+    """手を打った後の盤面を送り、勝敗の判定と次の手番の案内をする"""
+    board_display = game.get_board_display()
+    if game.winner:
+        await show_board(channel, game, f"{board_display}\n{game.winner.mention} の勝利でございますわ！🎉", final=True)
+        drop_game(channel.id)
+    elif game.board.is_full():
+        await show_board(channel, game, f"{board_display}\n引き分けでございますわ。", final=True)
+        drop_game(channel.id)
+    else:
+        save_game(channel.id, game)
+        await show_board(channel, game, f"{board_display}\n次は {game.players[game.current].mention} の番でございますわ。")
+        if game.players[game.current] == bot.user:
+            await play_bot_move(channel, game)
+
+async def play_bot_move(channel, game):
+    # 探索はワーカーで行い、ほかのチャンネルの進行を止めない
+    level = LEVELS[game.level]
+    board = game.board
+    col = await search_pool.run(
+        choose_column, board.boards[game.current], board.mask, board.moves,
+        level.max_depth, level.time_ms,
+    )
+    # 考えている間に中断されていたら何もしない
+    if games.get(channel.id) is not game or col is None:
+        return
+    game.place_piece(COLUMNS[col])
+    await announce_move(channel, game)
+
 @bot.command()
-async def con(ctx):
+async def con(ctx, opponent: Optional[discord.User] = None, level: str = DEFAULT_LEVEL):
+    """!con で参加者を募集、!con @Bot [easy|normal|hard] で Bot と対戦"""
     if ctx.channel.id in games:
         await ctx.send("既にゲームが進行中でございますわ。")
         return
 
+    if opponent is not None and opponent == bot.user:
+        if level not in LEVELS:
+            await ctx.send(f"強さは {' / '.join(LEVELS)} からお選びくださいませ。")
+            return
+        game = Connect4Game(ctx.author, bot.user, level)
+        games[ctx.channel.id] = game
+        await start_game(ctx.channel, game)
+        return
+
     view = JoinView(ctx.author)
     await ctx.send(f"{ctx.author.mention} がコネクトフォーを開始しましたわ。参加者は下のボタンを押して下さいませ。", view=view)
     await view.wait()
@@ -105,40 +265,68 @@ async def con(ctx):
 
     game = Connect4Game(ctx.author, view.opponent)
     games[ctx.channel.id] = game
-    await ctx.send(f"{game.players[0].mention} vs {game.players[1].mention} ゲーム開始ですわ！\n{game.players[game.current].mention} が先攻ですわ。\n{game.get_board_display()}")
+    await start_game(ctx.channel, game)
+
+async def end_game(ctx):
+    """チャンネルのゲームを中断する（中断したら True）"""
+    if ctx.channel.id not in games:
+        return False
+    game = drop_game(ctx.channel.id)
+    if game.board_message:
+        await game.board_message.close()
+    await ctx.send("ゲームを中断いたしましたわ。")
+    return True
 
 @bot.command()
 async def end(ctx):
-    if ctx.channel.id not in games:
+    if not await end_game(ctx):
         await ctx.send("ゲームは進行しておりませんわ。")
+
+async def restore_game(channel_id, data, channel):
+    """保存されていた対局を読み戻し、チャンネルに再開を知らせる"""
+    game = games[channel_id] = await unpack_game(data)
+    router.add(channel_id, STATE_KIND, handle_message)
+    save_game(channel_id, game)
+    await show_board(channel, game, f"Bot が再起動いたしましたので、対局を再開いたしますわ。\n{game.get_board_display()}\n次は {game.players[game.current].mention} の番でございますわ。")
+    if game.players[game.current] == bot.user:
+        await play_bot_move(channel, game)
+
+saved_games = SavedGames(STATE_KIND, games, restore_game, channel_of=key_channel_id)
+
+@bot.listen("on_ready")
+async def restore_once():
+    await saved_games.restore_once(bot)
+
+async def handle_message(message):
+    """ゲームのあるチャンネルのメッセージ。手番の人の列の入力なら石を落とす"""
+    game = games.get(message.channel.id)
+    if not (game and game.active and message.author == game.players[game.current]):
+        return
+    move = MOVE_PATTERN.fullmatch(message.content)
+    if move is None:
         return
-    del games[ctx.channel.id]
-    await ctx.send("ゲームを中断いたしましたわ。")
 
-@bot.event
-async def on_message(message):
-    if message.author.bot:
+    success, error = game.place_piece(move.group(1).upper())
+    if not success:
+        await message.channel.send(error)
         return
+    await announce_move(message.channel, game)
 
-    game = games.get(message.channel.id)
-    if game and game.active and message.author == game.players[game.current]:
-        content = message.content.strip().upper()
-        if content in COLUMNS:
-            success, error = game.place_piece(content)
-            if not success:
-                await message.channel.send(error)
-                return
+@bot.event
+async def on_message(message):
+    await route_message(bot, message)
 
-            board_display = game.get_board_display()
-            if game.winner:
-                await message.channel.send(f"{board_display}\n{game.winner.mention} の勝利でございますわ！🎉")
-                del games[message.channel.id]
-            else:
-                await message.channel.send(f"{board_display}\n次は {game.players[game.current].mention} の番でございますわ。")
-            return
+def warm_up():
+    """定石ブックを先に開いておく"""
+    get_book()
 
-    await bot.process_commands(message)
+async def setup(host):
+    global bot
+    host.adopt(bot, listeners=[(restore_once, "on_ready")], end_game=end_game)
+    bot = host
 
 # 起動処理
-load_dotenv()
-bot.run(os.getenv("DISCORD_TOKEN"))
+if __name__ == "__main__":
+    load_dotenv()
+    warm_up()
+    bot.run(os.getenv("DISCORD_TOKEN"))
@@ -0,0 +1,165 @@
+"""全ゲームを 1 つのプロセス・1 つの Bot で動かすホスト
+
+各ゲームのモジュールを discord.py の拡張として読み込み、
+ゲートウェイ接続・HTTP セッション・描画/探索プールを共有する。
+モジュールごとにあった !end はここでまとめて受け付け、各ゲームの終了処理に振り分ける。
+
+    python game_host.py
+    python game_host.py --shard-count 4 --shard-ids 0 1   # シャードの一部だけを受け持つ
+
+起動時には各ゲームの warm_up()（画像の読み込みや表の構築）を済ませてからゲートウェイにつなぐ。
+--profile を付けると、ゲームごとの読み込みと warm-up にかかった時間を表示する。
+
+シャードごとに担当するサーバーが決まっているので、ゲームの状態（games / active_games）は
+そのサーバーを受け持つプロセスの中だけにあればよい。複数プロセスの起動と監視は shard_supervisor.py が行う。
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+import discord
+from discord.ext import commands
+from dotenv import load_dotenv
+
+from game_store import get_store
+import session_registry
+from message_router import route_message
+
+# 読み込むゲーム（各モジュールに async def setup(bot) がある）
+EXTENSIONS = ("janken_bot", "jankenhoitour_bot", "connect4_bot", "hit_and_blow", "osero")
+
+
+@commands.command()
+async def end(ctx):
+    """そのチャンネル（サーバー）で進行中のゲームをすべて終了する"""
+    ended = False
+    for end_game in ctx.bot.end_handlers:
+        ended = await end_game(ctx) or ended
+    if not ended:
+        await ctx.send("進行中のゲームはありません。")
+
+
+# 起動時の設定（コマンドライン引数でも指定できる）
+#   GAME_HOST_WARMUP  : 0 で warm-up を省略（最初の 1 局目で読み込む）
+#   GAME_HOST_PROFILE : 1 で起動時間の内訳を表示
+WARM_UP = os.getenv("GAME_HOST_WARMUP", "1") == "1"
+PROFILE = os.getenv("GAME_HOST_PROFILE", "0") == "1"
+
+# 生存確認ファイルを書き換える間隔（秒）
+HEARTBEAT_INTERVAL = 10
+
+
+@commands.command()
+async def sessions(ctx):
+    """ゲームの種類ごとのセッション数を表示する"""
+    stats = session_registry.sessions.stats()
+    if not stats:
+        await ctx.send("セッションはまだありません。")
+        return
+    lines = [
+        f"{kind}: 進行中 {live} / 開始 {started} / 終了 {ended} / 期限切れ {reaped}"
+        for kind, (live, started, ended, reaped) in stats.items()
+    ]
+    await ctx.send("\n".join(lines))
+
+
+class GameHost(commands.AutoShardedBot):
+    def __init__(self, shard_ids=None, shard_count=None, heartbeat=None, warm_up=WARM_UP, profile=PROFILE):
+        intents = discord.Intents.default()
+        intents.message_content = True
+        # shard_ids / shard_count を省略すると Discord の推奨数で全シャードを受け持つ
+        super().__init__(command_prefix="!", intents=intents, shard_ids=shard_ids, shard_count=shard_count)
+        # !end で呼ぶ各ゲームの終了処理（ゲームを終わらせたら True を返す）
+        self.end_handlers = []
+        self.heartbeat = heartbeat
+        self.warm_up = warm_up
+        self.profile = profile
+        self.add_command(end)
+        self.add_command(sessions)
+
+    async def setup_hook(self):
+        # setup_hook が終わるまではゲートウェイにつながらない（＝ ready にならない）
+        timings = []
+        started = time.perf_counter()
+        # 状態の保存先は開くときに古い行を詰めるので、最初の 1 手より前にイベントループの外で開いておく
+        await asyncio.to_thread(get_store)
+        for name in EXTENSIONS:
+            begin = time.perf_counter()
+            await self.load_extension(name)
+            timings.append((name, "load", time.perf_counter() - begin))
+        if self.warm_up:
+            for name in EXTENSIONS:
+                warm_up = getattr(self.extensions[name], "warm_up", None)
+                if warm_up is None:
+                    continue
+                begin = time.perf_counter()
+                # ファイルの読み込みや表の構築はイベントループの外で行う
+                await asyncio.to_thread(warm_up)
+                timings.append((name, "warm-up", time.perf_counter() - begin))
+        if self.profile:
+            for name, phase, elapsed in timings:
+                print(f"[profile] {name:<20} {phase:<8} {elapsed * 1000:8.1f} ms")
+            print(f"[profile] {'合計':<20} {'':<8} {(time.perf_counter() - started) * 1000:8.1f} ms")
+        if self.heartbeat:
+            self.heartbeat_task = asyncio.create_task(self.write_heartbeat())
+
+    def healthy(self):
+        """受け持ちのシャードがすべてつながっているか"""
+        return self.is_ready() and all(not shard.is_closed() for shard in self.shards.values())
+
+    async def write_heartbeat(self):
+        """正常な間だけ、スーパーバイザーが見る生存確認ファイルに時刻を書く"""
+        while not self.is_closed():
+            if self.healthy():
+                with open(self.heartbeat, "w") as f:
+                    f.write(str(time.time()))
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+    async def on_message(self, message):
+        # 各ゲームの入力はチャンネルごとの表から直接渡し、コマンドだけを process_commands に回す
+        await route_message(self, message)
+
+    async def on_ready(self):
+        print(f"{self.user} としてログインしました（{len(self.extensions)} ゲーム、シャード {sorted(self.shards)}）")
+
+    def adopt(self, source, listeners=(), end_game=None, views=()):
+        """
+        単体起動用の Bot（source）に登録されたコマンドをこちらへ移す。
+        on_ready などのイベントは listeners で渡す（メッセージは message_router が振り分ける）。
+        再起動前に送ったボタンを受け付ける永続ビューは views で渡す。
+        """
+        for command in list(source.commands):
+            # !end はホストでまとめて、!help はホストのものを使う
+            if command.name in ("end", "help"):
+                continue
+            source.remove_command(command.name)
+            self.add_command(command)
+        for func, name in listeners:
+            self.add_listener(func, name)
+        if end_game is not None:
+            self.end_handlers.append(end_game)
+        for view in views:
+            self.add_view(view)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="全ゲームを 1 つの Bot で起動します")
+    parser.add_argument("--shard-count", type=int, default=None, help="全体のシャード数")
+    parser.add_argument("--shard-ids", type=int, nargs="+", default=None, help="このプロセスが受け持つシャード番号")
+    parser.add_argument("--heartbeat", default=None, help="生存確認ファイル（スーパーバイザー用）")
+    parser.add_argument("--no-warm-up", dest="warm_up", action="store_false", default=WARM_UP,
+                        help="画像や表を先に読み込まない")
+    parser.add_argument("--profile", action="store_true", default=PROFILE, help="起動時間の内訳を表示する")
+    args = parser.parse_args(argv)
+    if args.shard_ids is not None and args.shard_count is None:
+        parser.error("--shard-ids を指定するときは --shard-count も指定してください")
+
+    load_dotenv()
+    host = GameHost(args.shard_ids, args.shard_count, args.heartbeat, args.warm_up, args.profile)
+    host.run(os.getenv("DISCORD_TOKEN"))
+
+
+if __name__ == "__main__":
+    main()
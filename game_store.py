@@ -0,0 +1,201 @@
+"""ゲーム状態の保存先（再起動・クラッシュ後の再開用）
+
+各ゲームは進行中の盤面を小さなバイト列（スナップショット）にして put し、
+終わったら delete する。起動時に load でゲームの種類ごとの最新のスナップショットを読み戻す。
+
+保存先は GAME_STATE_BACKEND で選ぶ。
+  sqlite : SQLite（WAL）に追記していく（既定）
+  memory : 保存しない
+SQLite への書き込みは専用スレッドが GAME_STATE_FLUSH_MS ごとにまとめて 1 トランザクションで行うので、
+put / delete はキューに積むだけですぐに戻る（イベントループや 1 手ごとの応答を待たせない）。
+書いた行が GAME_STATE_COMPACT_ROWS を超えるたびに、同じスレッドで古い行を詰める。
+起動後に保存されていたゲームを読み戻すときは、ゲームごとに SavedGames を 1 つ作って restore_once を呼ぶ。
+"""
+
+import asyncio
+import atexit
+import os
+import sqlite3
+import struct
+import threading
+from pathlib import Path
+
+BACKEND = os.getenv("GAME_STATE_BACKEND", "sqlite").lower()
+STATE_PATH = Path(os.getenv("GAME_STATE_PATH", Path(__file__).resolve().parent / "game_state.db"))
+# 書き込みをまとめる間隔（ミリ秒）
+FLUSH_MS = int(os.getenv("GAME_STATE_FLUSH_MS", "200"))
+# この行数を書くたびに古い行を詰める
+COMPACT_ROWS = int(os.getenv("GAME_STATE_COMPACT_ROWS", "10000"))
+
+
+class StateStore:
+    """何も保存しない保存先（ほかの保存先はこれを継承する）"""
+
+    def put(self, kind, key, data):
+        pass
+
+    def delete(self, kind, key):
+        pass
+
+    def load(self, kind):
+        """{キー: スナップショット} を返す"""
+        return {}
+
+    def close(self):
+        pass
+
+
+class SQLiteStore(StateStore):
+    """
+    (kind, key, data) を追記していくだけのログ。data が NULL の行は削除を表す。
+    同じゲームの更新が 1 回の書き込みの間に何度あっても、最後の 1 件だけを書く。
+    古い行は開いたときと、compact_rows 行書くたびに詰める。
+    """
+
+    def __init__(self, path, flush_ms=FLUSH_MS, compact_rows=COMPACT_ROWS):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        # 書き込みスレッドと load の呼び出し元で接続を共有する
+        self.db_lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            " seq INTEGER PRIMARY KEY, kind TEXT NOT NULL, key INTEGER NOT NULL, data BLOB)"
+        )
+        self.compact()
+
+        self.interval = flush_ms / 1000
+        self.compact_rows = compact_rows
+        self.written = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.writer = threading.Thread(target=self.run, name="game-state-writer", daemon=True)
+        self.writer.start()
+
+    def compact(self):
+        """ゲームごとの最新の行だけを残し、削除済みのゲームは消す"""
+        with self.db_lock, self.db:
+            self.db.execute(
+                "DELETE FROM events WHERE seq NOT IN (SELECT MAX(seq) FROM events GROUP BY kind, key)"
+            )
+            self.db.execute("DELETE FROM events WHERE data IS NULL")
+
+    def put(self, kind, key, data):
+        with self.lock:
+            self.pending[kind, key] = bytes(data)
+
+    def delete(self, kind, key):
+        with self.lock:
+            self.pending[kind, key] = None
+
+    def load(self, kind):
+        self.flush()
+        with self.db_lock:
+            rows = self.db.execute(
+                "SELECT key, data FROM events WHERE seq IN"
+                " (SELECT MAX(seq) FROM events WHERE kind = ? GROUP BY key)",
+                (kind,),
+            ).fetchall()
+        return {key: data for key, data in rows if data is not None}
+
+    def flush(self):
+        with self.lock:
+            batch, self.pending = self.pending, {}
+        if not batch:
+            return
+        rows = [(kind, key, data) for (kind, key), data in batch.items()]
+        with self.db_lock, self.db:
+            self.db.executemany("INSERT INTO events (kind, key, data) VALUES (?, ?, ?)", rows)
+        self.written += len(rows)
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.flush()
+            if self.written >= self.compact_rows:
+                self.written = 0
+                self.compact()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        self.writer.join()
+        self.flush()
+        self.db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """
+    設定に応じた保存先を一度だけ作って返す。
+    初回は接続と古い行の詰め直しで時間がかかるので、イベントループからは asyncio.to_thread で呼ぶ。
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if BACKEND == "sqlite":
+                    store = SQLiteStore(STATE_PATH)
+                elif BACKEND == "memory":
+                    store = StateStore()
+                else:
+                    raise ValueError(f"GAME_STATE_BACKEND は sqlite か memory を指定してください: {BACKEND}")
+                # 終了時に書き込み待ちの分を書き切る
+                atexit.register(store.close)
+                _store = store
+    return _store
+
+
+# 多くのスナップショットは先頭にチャンネル ID（uint64）を入れている
+CHANNEL_ID = struct.Struct("<Q")
+
+
+def leading_channel_id(key, data):
+    """スナップショットの先頭に入れたチャンネル ID"""
+    return CHANNEL_ID.unpack_from(data)[0]
+
+
+def key_channel_id(key, data):
+    """チャンネル ID をキーにして保存しているゲーム用"""
+    return key
+
+
+class SavedGames:
+    """
+    ある種類の保存されたゲームを、起動後最初の on_ready で一度だけ読み戻す。
+    active は進行中のゲームの辞書（キーは保存時と同じ）、
+    restore(key, data, channel) はゲーム 1 つを読み戻して再開する。
+    """
+
+    def __init__(self, kind, active, restore, channel_of=leading_channel_id):
+        self.kind = kind
+        self.active = active
+        self.restore = restore
+        self.channel_of = channel_of
+        self.done = False
+
+    async def restore_once(self, bot):
+        # on_ready は再接続のたびに呼ばれるので、読み戻しは最初の 1 回だけ
+        if self.done:
+            return
+        self.done = True
+        store = await asyncio.to_thread(get_store)
+        saved = await asyncio.to_thread(store.load, self.kind)
+        for key, data in saved.items():
+            channel = bot.get_channel(self.channel_of(key, data))
+            if channel is None or key in self.active:
+                # 別のシャードが受け持つチャンネルか、すでに始まっている
+                continue
+            await self.restore(key, data, channel)
+
+
+async def resolve_user(bot, user_id):
+    """保存しておいた ID からユーザーを取り戻す（キャッシュになければ問い合わせる）"""
+    return bot.get_user(user_id) or await bot.fetch_user(user_id)
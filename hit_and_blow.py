@@ -2,10 +2,18 @@
 from discord.ext import commands
 import random
 import asyncio
+import struct
 from dotenv import load_dotenv
 import os
-from PIL import Image
-from pathlib import Path
+from typing import Optional
+from hit_blow_core import HitBlowCore
+from hit_blow_solver import (
+    decode, encode, feedback_value, get_table, hint as solver_hint, next_guess, possible_secrets, split_feedback,
+)
+from worker_pool import search_pool
+from game_store import SavedGames, get_store, resolve_user
+from session_registry import IDLE_TIMEOUT, sessions
+from message_router import route_message, router
 
 intents = discord.Intents.default()
 intents.message_content = True
@@ -14,9 +22,6 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 # アクティブゲーム格納
 active_games = {}
 
-# 画像フォルダのパス
-IMAGE_DIR = Path(__file__).resolve().parent / "image"
-
 # 色絵文字マッピング
 COLOR_EMOJIS = {
     "r": "<:red:1362318988365004870>",
@@ -27,20 +32,6 @@ COLOR_EMOJIS = {
     "w": "<:white:1362319002541490218>"
 }
 
-# 画像合成用ファイルパス
-COLOR_IMAGE_FILES = {
-    "r": IMAGE_DIR / "red.png",
-    "y": IMAGE_DIR / "yellow.png",
-    "g": IMAGE_DIR / "green.png",
-    "b": IMAGE_DIR / "blue.png",
-    "p": IMAGE_DIR / "purple.png",
-    "w": IMAGE_DIR / "white.png",
-}
-
-
-# EMOJI_LIST の定義
-EMOJI_LIST = list(COLOR_EMOJIS.values())
-
 def generate_guess_emoji(guess):
     """
     guess: ['r', 'y', 'g', 'b']
@@ -48,157 +39,230 @@ def generate_guess_emoji(guess):
     """
     return ''.join(COLOR_EMOJIS[c] for c in guess)
 
-def calculate_hit_blow(secret, guess):
-    hits = sum(s == g for s, g in zip(secret, guess))
-    blows = sum(min(secret.count(c), guess.count(c)) for c in set(guess)) - hits
-    return hits, blows
+def format_history_line(number, guess, hits, blows):
+    return f"{number}. {generate_guess_emoji(guess)} → {hits}H {blows}B"
+
+# Discord の 1 メッセージあたりの文字数上限
+MESSAGE_LIMIT = 2000
+
+def split_message(text, limit=MESSAGE_LIMIT):
+    """上限を超える文字列を行の切れ目で分割する"""
+    chunks = []
+    current = ""
+    for line in text.split("\n"):
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit and current:
+            chunks.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+class OutputBuffer:
+    """1 ターンの間に出た出力をためておき、まとめて 1 通で送る"""
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.parts = []
+
+    def add(self, text):
+        self.parts.append(text)
+
+    async def flush(self):
+        if not self.parts:
+            return
+        text = "\n".join(self.parts)
+        self.parts.clear()
+        for chunk in split_message(text):
+            await self.channel.send(chunk)
+
+# 進行中のゲームのスナップショット（再起動後の再開用）
+#   チャンネル ID、手番のプレイヤー ID、色かぶりモード、ターン数上限、ターンの位置、経過ターン数、正解、参加人数
+#   に続けて参加者の ID、推測ごとに (コード番号, hits * 5 + blows)
+STATE_KIND = "hit_and_blow"
+SNAPSHOT_HEADER = struct.Struct("<QQBBHHHB")
+PLAYER_ID = struct.Struct("<Q")
+LOG_ENTRY = struct.Struct("<HB")
+MODE_CODES = {False: 0, True: 1, None: 2}
+
+def pack_game(game):
+    current = game.current_player.id if game.current_player else 0
+    parts = [SNAPSHOT_HEADER.pack(
+        game.channel.id, current, MODE_CODES[game.allow_duplicates], game.max_turns,
+        game.turn_index, game.turn_count, encode(game.secret), len(game.players),
+    )]
+    parts.extend(PLAYER_ID.pack(player.id) for player in game.players)
+    parts.extend(LOG_ENTRY.pack(encode(guess), feedback_value(hits, blows)) for guess, hits, blows in game.guess_log)
+    return b"".join(parts)
+
+async def unpack_game(data, channel):
+    (_, current, mode, max_turns, turn_index, turn_count,
+     secret, player_count) = SNAPSHOT_HEADER.unpack_from(data)
+    offset = SNAPSHOT_HEADER.size
+    players = []
+    for _ in range(player_count):
+        (player_id,) = PLAYER_ID.unpack_from(data, offset)
+        players.append(await resolve_user(bot, player_id))
+        offset += PLAYER_ID.size
+
+    allow_duplicates = next(value for value, code in MODE_CODES.items() if code == mode)
+    game = HitBlowGame(channel, players, allow_duplicates, max_turns)
+    game.turn_index = turn_index
+    game.turn_count = turn_count
+    game.secret = list(decode(secret))
+    game.current_player = next((p for p in players if p.id == current), None)
+    for guess, value in LOG_ENTRY.iter_unpack(data[offset:]):
+        hits, blows = split_feedback(value)
+        game.guess_log.append((list(decode(guess)), hits, blows))
+        game.history_lines.append(format_history_line(len(game.guess_log), decode(guess), hits, blows))
+    return game
+
+class HitBlowGame(HitBlowCore):
+    """HitBlowCore に Discord への送受信を付けたもの"""
 
-class HitBlowGame:
     def __init__(self, ctx, players, allow_duplicates, max_turns):
-        self.ctx = ctx
-        self.players = players
-        self.allow_duplicates = allow_duplicates  # True:⭕, False:❌, None:ランダム
-        self.max_turns = max_turns
-        self.turn_index = 0
-        self.turn_count = 0
-        self.secret = self.generate_secret()
-        self.guess_log = []
-        self.running = True
-        self.current_player = None
-
-    def generate_secret(self):
-        """
-        allow_duplicates:
-         - True  → 色かぶり⭕（必ずどこかに重複あり）
-         - False → 色かぶり❌（完全にユニーク）
-         - None  → ランダム：重複あり or なし をランダム選択、
-                     重複ありの場合も必ずとはせずランダムで作成
-        """
-        mode = self.allow_duplicates
-        if mode is None:
-            mode = random.choice([True, False])
-
-        if mode:
-            # 重複を許可しつつ、重複が発生するかどうかも半分の確率で決定
-            if random.choice([True, False]):
-                # ２つだけ必ず重複させる
-                duplicated = random.choice(EMOJI_LIST)
-                others = random.sample([e for e in EMOJI_LIST if e != duplicated], 2)
-                secret = [duplicated, duplicated] + others
-            else:
-                # 重複なしで生成
-                secret = random.sample(EMOJI_LIST, 4)
-        else:
-            # 完全に重複なし
-            secret = random.sample(EMOJI_LIST, 4)
-
-        random.shuffle(secret)
-        return secret
+        super().__init__(players, allow_duplicates, max_turns)
+        self.ctx = ctx  # 再開したゲームではコマンドの ctx の代わりにチャンネルが入る
+        self.channel = getattr(ctx, "channel", ctx)
+        self.out = OutputBuffer(ctx)
+        self.history_lines = []  # 推測ごとに 1 行ずつ作って持っておく
+        self.bot_task = None  # 進行中の Bot の手番
+
+    def save(self):
+        """進行中なら状態を保存する（書き込みはまとめて別スレッドで行われる）"""
+        if self.running:
+            get_store().put(STATE_KIND, self.ctx.guild.id, pack_game(self))
+            sessions.touch(STATE_KIND, self.ctx.guild.id, IDLE_TIMEOUT, expire_game)
+
+    def drop(self):
+        active_games.pop(self.ctx.guild.id, None)
+        router.discard(self.channel.id, STATE_KIND)
+        get_store().delete(STATE_KIND, self.ctx.guild.id)
+        sessions.remove(STATE_KIND, self.ctx.guild.id)
+        # Bot の手番の途中で終わったゲームなら止める（Bot の手番そのものから終わった場合は除く）
+        if self.bot_task and self.bot_task is not asyncio.current_task():
+            self.bot_task.cancel()
 
     async def start(self):
-        emoji_list   = ' '.join(COLOR_EMOJIS[c] for c in 'rygbpw')
-        abbreviation = ' '.join(f"{c}={COLOR_EMOJIS[c]}" for c in 'rygbpw')
         mode_text    = ('色かぶりランダム' if self.allow_duplicates is None
                         else '色かぶり⭕' if self.allow_duplicates
                         else '色かぶり❌')
 
-        await self.ctx.send(
+        # このチャンネルのメッセージだけを推測として受け取る
+        router.add(self.channel.id, STATE_KIND, handle_message)
+        self.out.add(
             f"🎯**Lets!ヒットアンドブロー!**（**{mode_text}**、**{self.max_turns}ターン制**）!joinで途中参加可\n"
         )
-        await self.next_turn()
+        self.next_turn()
+        self.save()
+        await self.out.flush()
 
-    async def next_turn(self):
+    def next_turn(self):
         if not self.running:
             return
 
-        if self.turn_count >= self.max_turns:
-            await self.ctx.send(f"💀 ターン数上限に達しました！\n正解は：{''.join(self.secret)}\nでした")
-            await self.show_results(None)
+        remaining = self.remaining_turns
+        player = self.advance_turn()
+        if player is None:
+            self.out.add(f"💀 ターン数上限に達しました！\n正解は：{generate_guess_emoji(self.secret)}\nでした")
+            self.show_results(None)
             return
 
-        player = self.players[self.turn_index % len(self.players)]
-        self.current_player = player
-
-        remaining = self.max_turns - self.turn_count
         abbreviation = ' '.join(f"{c}={COLOR_EMOJIS[c]}" for c in 'rygbpw')
-        await self.ctx.send(
+        self.out.add(
             f"⏳ {player.mention} さんのターン！（残り**{remaining}**ターン）\n"
             f"Color: {abbreviation}"
         )
 
-        self.turn_index += 1
-        self.turn_count += 1
+        # Bot の番なら、ヒントと同じソルバーで推測させる
+        if player == bot.user:
+            self.schedule_bot_turn()
 
-    async def handle_guess(self, user, message):
-           if not self.running or user != self.current_player:
-               return
+    def schedule_bot_turn(self):
+        """Bot の手番をタスクで進める（タスクはゲームが持ち、終わったら手放す）"""
+        self.bot_task = asyncio.create_task(self.play_bot_turn())
+        self.bot_task.add_done_callback(self.bot_turn_done)
 
-           # ユーザーの入力を取得
-           raw = message.content.strip().lower()
+    def bot_turn_done(self, task):
+        if self.bot_task is task:
+            self.bot_task = None
+        if not task.cancelled() and task.exception():
+            print(f"[hit_and_blow] Bot の手番でエラーが発生しました: {task.exception()!r}")
 
-           # 入力の検証
-           if len(raw) != 4 or any(c not in COLOR_IMAGE_FILES for c in raw):
-               return  # メッセージ送信をスキップ
+    async def play_bot_turn(self):
+        await asyncio.sleep(1)
+        if not self.running or self.current_player != bot.user:
+            return
+        history = [(encode(g), h, b) for g, h, b in self.guess_log]
+        guess = await search_pool.run(next_guess, self.allow_duplicates, history)
+        if guess is None:
+            return
+        guess = decode(guess)
+        self.out.add(f"🤖 {guess}")
+        await self.play_guess(bot.user, guess)
 
-           guess = list(raw)
-           hits, blows = calculate_hit_blow(self.secret, [COLOR_EMOJIS[c] for c in guess])
-           self.guess_log.append((guess, hits, blows))
+    async def handle_guess(self, user, message):
+        await self.play_guess(user, message.content)
 
-           # 絵文字結果を生成
-           emoji_result = generate_guess_emoji(guess)
-           await message.channel.send(
-               content=f"🎯 **{hits}ヒット {blows}ブロー** {emoji_result}"
-           )
+    async def play_guess(self, user, raw):
+        # 手番でない・入力が不正なときはメッセージ送信をスキップ
+        result = self.submit(user, raw)
+        if result is None:
+            await self.out.flush()
+            return
+        guess, hits, blows = result
 
-           if hits == 4:
-               await self.show_results(winner=user)
-               return
+        # 絵文字結果を生成
+        emoji_result = generate_guess_emoji(guess)
+        self.history_lines.append(format_history_line(len(self.guess_log), guess, hits, blows))
+        self.out.add(f"🎯 **{hits}ヒット {blows}ブロー** {emoji_result}")
 
-           await self.next_turn()
-           await self.show_history()
+        if hits == 4:
+            self.show_results(winner=user)
+        else:
+            self.next_turn()
+            self.show_history()
+        self.save()
+        await self.out.flush()
 
-    async def show_results(self, winner):
+    def show_results(self, winner):
         if winner:
-            await self.ctx.send(f"🏆 {winner.mention} さんが正解しました！🎉")
+            self.out.add(f"🏆 {winner.mention} さんが正解しました！🎉")
 
-        if not self.guess_log:
-            await self.ctx.send("📜 結果がありません。")
+        if not self.history_lines:
+            self.out.add("📜 結果がありません。")
             return
 
-        lines = []
-        for i, (guess_abbr, hits, blows) in enumerate(self.guess_log, 1):
-            emoji_guess = ''.join(COLOR_EMOJIS[c] for c in guess_abbr)
-            lines.append(f"{i}. {emoji_guess} → {hits}H {blows}B")
+        self.out.add("📜 **最終結果：**\n" + "\n".join(self.history_lines) + "\n")
 
-        await self.ctx.send("📜 **最終結果：**\n" + "\n".join(lines) + "\n")
+        self.finish()
+        self.drop()
 
-        self.running = False
-        active_games.pop(self.ctx.guild.id, None)
-
-    async def show_history(self):
-        if not self.guess_log:
-            await self.ctx.send("📭 まだ履歴がありません。")
+    def show_history(self):
+        if not self.history_lines:
+            self.out.add("📭 まだ履歴がありません。")
             return
 
-        lines = []
-        for i, (guess_abbr, hits, blows) in enumerate(self.guess_log, 1):
-            emoji_guess = ''.join(COLOR_EMOJIS[c] for c in guess_abbr)
-            lines.append(f"{i}. {emoji_guess} → {hits}H {blows}B")
-
-        await self.ctx.send("📜 **現在の履歴**\n" + "\n".join(lines) + "\n")
+        self.out.add("📜 **現在の履歴**\n" + "\n".join(self.history_lines) + "\n")
 
     async def exit_player(self, user):
-        if user in self.players:
-            self.players.remove(user)
-            await self.ctx.send(f"👋 {user.display_name} さんが退出しました。")
+        if self.remove_player(user):
+            self.out.add(f"👋 {user.display_name} さんが退出しました。")
             if not self.players:
-                await self.force_end()
+                self.end_game()
+            self.save()
+        await self.out.flush()
+
+    def end_game(self):
+        self.out.add(f"🛑 ゲームが中断されました！答えは：{generate_guess_emoji(self.secret)}")
+        self.show_results(None)
+        self.finish()
+        self.drop()  # ゲームを確実に削除
 
     async def force_end(self):
-        await self.ctx.send(f"🛑 ゲームが中断されました！答えは：{''.join(self.secret)}")
-        await self.show_results(None)
-        self.running = False
-        active_games.pop(self.ctx.guild.id, None)  # ゲームを確実に削除
+        self.end_game()
+        await self.out.flush()
 
 @bot.command()
 async def hit(ctx):
@@ -212,17 +276,37 @@ async def hit(ctx):
          view=ModeSelectView(ctx),
      )
 
+async def end_game(ctx):
+    """サーバーのゲームを中断する（中断したら True）"""
+    game = active_games.get(ctx.guild.id) if ctx.guild else None
+    if not (game and game.running):
+        return False
+    await game.force_end()
+    return True
+
 @bot.command()
 async def end(ctx):
-    game = active_games.get(ctx.guild.id)
-    if game and game.running:
-        await game.force_end()
+    await end_game(ctx)
 
 @bot.command()
 async def his(ctx):
     game = active_games.get(ctx.guild.id)
     if game and game.running:
-        await game.show_history()
+        game.show_history()
+        await game.out.flush()
+
+@bot.command()
+async def hint(ctx):
+    game = active_games.get(ctx.guild.id)
+    if not (game and game.running):
+        return await ctx.send("🚫 進行中のゲームはございません。")
+
+    history = [(encode(g), h, b) for g, h, b in game.guess_log]
+    # 候補の絞り込みは重いのでワーカーで計算する
+    count, guess = await search_pool.run(solver_hint, game.allow_duplicates, history)
+    if guess is None:
+        return await ctx.send("🤔 条件に合う答えが見つかりません。")
+    await ctx.send(f"💡 残りの候補は **{count}** 通り！おすすめ：{generate_guess_emoji(guess)}（`{guess}`）")
 
 @bot.command()
 async def exit(ctx):
@@ -231,16 +315,17 @@ async def exit(ctx):
         await game.exit_player(ctx.author)
 
 @bot.command()
-async def join(ctx):
+async def join(ctx, member: Optional[discord.User] = None):
+    """!join で自分が、!join @Bot で Bot が途中参加する"""
     game = active_games.get(ctx.guild.id)
     if game and game.running:
-        if ctx.author in game.players:
+        player = bot.user if member == bot.user else ctx.author
+        if player in game.players:
             return await ctx.send("🚫 既に参加なさっております。")
         # 次のターンに合流できるよう挿入
-        new_len = len(game.players) + 1
-        pos = game.turn_index % new_len
-        game.players.insert(pos, ctx.author)
-        await ctx.send(f"🎉 {ctx.author.mention} さんが参加しました！（次のターンが {ctx.author.mention} さんの番です。） ")
+        game.add_player(player)
+        game.save()
+        await ctx.send(f"🎉 {player.mention} さんが参加しました！（次のターンが {player.mention} さんの番です。） ")
     else:
         await ctx.send("🚫 現在参加可能なゲームはございません。")
 
@@ -361,18 +446,53 @@ class EntryView(discord.ui.View):
 
 @bot.event
 async def on_message(message):
-    # 1. 既存のコマンドを処理
-    await bot.process_commands(message)
+    await route_message(bot, message)
 
-    # 2. Bot自身や他のBotのメッセージは無視
-    if message.author.bot:
-        return
+async def expire_game(guild_id):
+    """しばらく操作のなかったゲームを片付ける"""
+    game = active_games.get(guild_id)
+    if game and game.running:
+        game.out.add("⌛ 一定時間操作がなかったため、ゲームを終了します。")
+        await game.force_end()
 
-    # 3. ギルド内ゲームがあり、プレフィックスでないメッセージなら推測ハンドル
+async def restore_game(guild_id, data, channel):
+    """保存されていたゲームを読み戻し、チャンネルに再開を知らせる"""
+    game = active_games[guild_id] = await unpack_game(data, channel)
+    router.add(channel.id, STATE_KIND, handle_message)
+    game.save()
+    game.out.add("🔄 Bot が再起動したため、ゲームを再開します。")
+    game.show_history()
+    if game.current_player:
+        game.out.add(f"⏳ {game.current_player.mention} さんのターン！（残り**{game.remaining_turns + 1}**ターン）")
+        if game.current_player == bot.user:
+            game.schedule_bot_turn()
+    await game.out.flush()
+
+saved_games = SavedGames(STATE_KIND, active_games, restore_game)
+
+@bot.listen("on_ready")
+async def restore_once():
+    await saved_games.restore_once(bot)
+
+async def handle_message(message):
+    # ゲームのチャンネルの、コマンドでない人間のメッセージだけが届く
     game = active_games.get(message.guild.id) if message.guild else None
-    if game and not message.content.startswith("!"):
+    if game:
         await game.handle_guess(message.author, message)
 
+def warm_up():
+    """ヒット・ブロー表と正解候補を先に用意しておく（初回の !hint や Bot の手が遅れないように）"""
+    get_table()
+    for allow_duplicates in (True, False, None):
+        possible_secrets(allow_duplicates)
+
+async def setup(host):
+    global bot
+    host.adopt(bot, listeners=[(restore_once, "on_ready")], end_game=end_game)
+    bot = host
+
 # 起動処理
-load_dotenv()
-bot.run(os.getenv("DISCORD_TOKEN"))
+if __name__ == "__main__":
+    load_dotenv()
+    warm_up()
+    bot.run(os.getenv("DISCORD_TOKEN"))
@@ -0,0 +1,114 @@
+"""ヒットアンドブローのゲーム進行（Discord に依存しない部分）
+
+秘密のコードや推測は 'r', 'y', 'g', 'b', 'p', 'w' の色文字のリストで持つ。
+Discord 側（hit_and_blow.py）とバッチシミュレーター（hit_blow_sim.py）の両方から使う。
+"""
+
+import random
+import re
+
+from hit_blow_solver import COLORS, SLOTS
+
+# 'rygb' のような推測の入力（前後の空白と大文字・小文字は問わない）
+GUESS_PATTERN = re.compile(rf"\s*([{COLORS}]{{{SLOTS}}})\s*", re.IGNORECASE)
+
+
+def calculate_hit_blow(secret, guess):
+    hits = sum(s == g for s, g in zip(secret, guess))
+    blows = sum(min(secret.count(c), guess.count(c)) for c in set(guess)) - hits
+    return hits, blows
+
+
+def generate_secret(allow_duplicates, rng=random):
+    """
+    allow_duplicates:
+     - True  → 色かぶり⭕（必ずどこかに重複あり）
+     - False → 色かぶり❌（完全にユニーク）
+     - None  → ランダム：重複あり or なし をランダム選択、
+                 重複ありの場合も必ずとはせずランダムで作成
+    """
+    colors = list(COLORS)
+    mode = allow_duplicates
+    if mode is None:
+        mode = rng.choice([True, False])
+
+    if mode:
+        # 重複を許可しつつ、重複が発生するかどうかも半分の確率で決定
+        if rng.choice([True, False]):
+            # ２つだけ必ず重複させる
+            duplicated = rng.choice(colors)
+            others = rng.sample([c for c in colors if c != duplicated], 2)
+            secret = [duplicated, duplicated] + others
+        else:
+            # 重複なしで生成
+            secret = rng.sample(colors, SLOTS)
+    else:
+        # 完全に重複なし
+        secret = rng.sample(colors, SLOTS)
+
+    rng.shuffle(secret)
+    return secret
+
+
+def parse_guess(raw):
+    """'rygb' のような入力を色文字のリストにする（不正なら None）"""
+    match = GUESS_PATTERN.fullmatch(raw)
+    if match is None:
+        return None
+    return list(match.group(1).lower())
+
+
+class HitBlowCore:
+    def __init__(self, players, allow_duplicates, max_turns, rng=random):
+        self.players = players
+        self.allow_duplicates = allow_duplicates  # True:⭕, False:❌, None:ランダム
+        self.max_turns = max_turns
+        self.turn_index = 0
+        self.turn_count = 0
+        self.secret = generate_secret(allow_duplicates, rng)
+        self.guess_log = []
+        self.running = True
+        self.current_player = None
+
+    @property
+    def remaining_turns(self):
+        return self.max_turns - self.turn_count
+
+    def advance_turn(self):
+        """次の手番のプレイヤーを返す。ターン数の上限に達していたら None"""
+        if self.turn_count >= self.max_turns:
+            return None
+        player = self.players[self.turn_index % len(self.players)]
+        self.current_player = player
+        self.turn_index += 1
+        self.turn_count += 1
+        return player
+
+    def submit(self, player, raw):
+        """
+        手番のプレイヤーの推測を判定して (guess, hits, blows) を返す。
+        手番でない・入力が不正なときは None。
+        """
+        if not self.running or player != self.current_player:
+            return None
+        guess = parse_guess(raw)
+        if guess is None:
+            return None
+        hits, blows = calculate_hit_blow(self.secret, guess)
+        self.guess_log.append((guess, hits, blows))
+        return guess, hits, blows
+
+    def add_player(self, player):
+        """次のターンに合流できる位置に差し込む"""
+        new_len = len(self.players) + 1
+        pos = self.turn_index % new_len
+        self.players.insert(pos, player)
+
+    def remove_player(self, player):
+        if player in self.players:
+            self.players.remove(player)
+            return True
+        return False
+
+    def finish(self):
+        self.running = False
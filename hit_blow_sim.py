@@ -0,0 +1,90 @@
+"""ヒットアンドブローのバッチシミュレーター
+
+Discord を使わずに HitBlowCore 上でソルバー Bot に大量のゲームを解かせ、
+色かぶりモードとターン数上限ごとのクリア率を集計する（ターン数調整用）。
+
+    python hit_blow_sim.py --games 1000000 --workers 8
+"""
+
+import argparse
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+from hit_blow_core import HitBlowCore
+from hit_blow_solver import decode, encode, get_table, next_guess
+
+MODES = {"dup": True, "nodup": False, "random": None}
+TURN_CHOICES = (4, 5, 6, 7, 8)
+
+SOLVER = "solver"
+
+
+def simulate(mode, games, max_turns, strategy, seed):
+    """games 回遊んで、何ターン目に正解したかの分布を返す（0 は時間切れ）"""
+    get_table()
+    rng = random.Random(seed)
+    solved_at = Counter()
+    for _ in range(games):
+        core = HitBlowCore([SOLVER], mode, max_turns, rng)
+        history = []
+        turn = 0
+        while core.advance_turn() is not None:
+            guess = decode(next_guess(mode, history, strategy))
+            _, hits, blows = core.submit(SOLVER, guess)
+            history.append((encode(guess), hits, blows))
+            if hits == 4:
+                turn = core.turn_count
+                break
+        solved_at[turn] += 1
+    return mode, solved_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ヒットアンドブローをソルバー同士で大量に遊ばせて集計します")
+    parser.add_argument("--games", type=int, default=100000, help="モードごとのゲーム数")
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=list(MODES), help="色かぶりモード")
+    parser.add_argument("--max-turns", type=int, nargs="+", default=list(TURN_CHOICES), help="集計するターン数上限")
+    parser.add_argument("--strategy", choices=("entropy", "minimax"), default="entropy")
+    parser.add_argument("--workers", type=int, default=None, help="並列に動かすプロセス数")
+    parser.add_argument("--chunk", type=int, default=10000, help="1 ジョブあたりのゲーム数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    # 表はファイルに作っておき、各ワーカーは mmap で共有する
+    get_table()
+
+    # 一番長い上限で遊ばせれば、短い上限でのクリア可否は正解したターンからわかる
+    longest = max(args.max_turns)
+    jobs = []
+    for name in args.modes:
+        for start in range(0, args.games, args.chunk):
+            count = min(args.chunk, args.games - start)
+            seed = args.seed * 1000003 + len(jobs)
+            jobs.append((MODES[name], count, longest, args.strategy, seed))
+
+    started = time.perf_counter()
+    totals = {MODES[name]: Counter() for name in args.modes}
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(simulate, *job) for job in jobs]
+        for future in futures:
+            mode, solved_at = future.result()
+            totals[mode].update(solved_at)
+    elapsed = time.perf_counter() - started
+
+    for name in args.modes:
+        solved_at = totals[MODES[name]]
+        played = sum(solved_at.values())
+        solved = {turn: n for turn, n in solved_at.items() if turn}
+        average = sum(turn * n for turn, n in solved.items()) / max(1, sum(solved.values()))
+        print(f"[{name}] {played} ゲーム / 平均 {average:.3f} ターンで正解")
+        for limit in sorted(args.max_turns):
+            cleared = sum(n for turn, n in solved.items() if turn <= limit)
+            print(f"  {limit}ターン制: クリア率 {cleared / played:.2%}")
+    total_games = sum(sum(c.values()) for c in totals.values())
+    print(f"{total_games} ゲームを {elapsed:.1f} 秒で処理しました")
+
+
+if __name__ == "__main__":
+    main()
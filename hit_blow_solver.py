@@ -0,0 +1,184 @@
+"""ヒットアンドブローのソルバーとヒント
+
+6 色 × 4 スロットの全 1296 通りについて、(推測, 正解) の組ごとの
+ヒット・ブロー数を 1296 x 1296 バイトの表にして持つ（値は hits * 5 + blows）。
+表は初回にファイルへ書き出し、以降は mmap で読むだけにする。
+推測の履歴から候補を絞り込み、情報量（エントロピー）か最悪ケース（ミニマックス）で次の一手を選ぶ。
+"""
+
+import math
+import mmap
+import os
+import tempfile
+from collections import Counter
+from functools import lru_cache
+from itertools import product
+from operator import itemgetter
+from pathlib import Path
+
+COLORS = "rygbpw"
+SLOTS = 4
+CODE_COUNT = len(COLORS) ** SLOTS
+
+# 全コード（色番号のタプル）。番号は 6 進数として読んだ値
+CODES = list(product(range(len(COLORS)), repeat=SLOTS))
+
+TABLE_PATH = Path(os.getenv("HIT_BLOW_TABLE_PATH", Path(__file__).resolve().parent / "hit_blow_table.bin"))
+
+# 履歴 → 次の一手 のメモの上限
+MEMO_LIMIT = 100000
+
+
+def encode(letters):
+    """'rygb' や ['r', 'y', 'g', 'b'] をコード番号にする"""
+    index = 0
+    for letter in letters:
+        index = index * len(COLORS) + COLORS.index(letter)
+    return index
+
+
+def decode(index):
+    """コード番号を 'rygb' のような文字列に戻す"""
+    return "".join(COLORS[c] for c in CODES[index])
+
+
+def feedback_value(hits, blows):
+    return hits * 5 + blows
+
+
+def split_feedback(value):
+    return divmod(value, 5)
+
+
+def build_table():
+    """全組み合わせのヒット・ブロー表を作る（1 秒ほどかかる）"""
+    # 色の個数の組み合わせは 126 通りしかないので、共通する色の数は先に表にしておく
+    profiles = {}
+    profile_of = []
+    for code in CODES:
+        counts = tuple(code.count(c) for c in range(len(COLORS)))
+        profile_of.append(profiles.setdefault(counts, len(profiles)))
+    by_id = sorted(profiles, key=profiles.get)
+    common = [[sum(map(min, a, b)) for b in by_id] for a in by_id]
+
+    table = bytearray(CODE_COUNT * CODE_COUNT)
+    for g, guess in enumerate(CODES):
+        g0, g1, g2, g3 = guess
+        row_common = common[profile_of[g]]
+        base = g * CODE_COUNT
+        for s, (s0, s1, s2, s3) in enumerate(CODES):
+            hits = (g0 == s0) + (g1 == s1) + (g2 == s2) + (g3 == s3)
+            table[base + s] = hits * 5 + row_common[profile_of[s]] - hits
+    return bytes(table)
+
+
+_table = None
+
+
+def get_table():
+    """表を（なければ作って保存してから）mmap で開く"""
+    global _table
+    if _table is None:
+        size = CODE_COUNT * CODE_COUNT
+        if not TABLE_PATH.exists() or TABLE_PATH.stat().st_size != size:
+            # 複数のプロセスが同時に作っても混ざらないよう、一時ファイルはプロセスごとに別名にする
+            with tempfile.NamedTemporaryFile(dir=TABLE_PATH.parent, prefix=TABLE_PATH.name, suffix=".tmp", delete=False) as tmp:
+                tmp.write(build_table())
+            try:
+                os.replace(tmp.name, TABLE_PATH)
+            except OSError:
+                os.unlink(tmp.name)
+                raise
+        with open(TABLE_PATH, "rb") as f:
+            _table = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _table
+
+
+def feedback(guess, secret):
+    """コード番号どうしの (hits, blows)"""
+    return split_feedback(get_table()[guess * CODE_COUNT + secret])
+
+
+@lru_cache(maxsize=None)
+def possible_secrets(allow_duplicates):
+    """
+    HitBlowGame.generate_secret が作りうる正解の一覧。
+      False       → 4 色すべて異なる
+      True / None → 上に加えて、1 色だけがちょうど 2 回使われるもの
+    """
+    secrets = []
+    for index, code in enumerate(CODES):
+        counts = sorted(code.count(c) for c in set(code))
+        if counts == [1, 1, 1, 1] or (allow_duplicates is not False and counts == [1, 1, 2]):
+            secrets.append(index)
+    return tuple(secrets)
+
+
+def filter_candidates(candidates, guess, value):
+    table = get_table()
+    base = guess * CODE_COUNT
+    return [s for s in candidates if table[base + s] == value]
+
+
+def candidates_from_log(allow_duplicates, history):
+    """history: (推測のコード番号, hits, blows) の並び"""
+    candidates = possible_secrets(allow_duplicates)
+    for guess, hits, blows in history:
+        candidates = filter_candidates(candidates, guess, feedback_value(hits, blows))
+    return candidates
+
+
+def score_guess(guess, candidates, strategy="entropy"):
+    """大きいほど良い推測"""
+    base = guess * CODE_COUNT
+    row = get_table()[base:base + CODE_COUNT]
+    if len(candidates) == 1:
+        buckets = Counter((row[candidates[0]],))
+    else:
+        buckets = Counter(itemgetter(*candidates)(row))
+    if strategy == "minimax":
+        return -max(buckets.values())
+    total = len(candidates)
+    return math.log2(total) - sum(n * math.log2(n) for n in buckets.values()) / total
+
+
+def best_guess(candidates, strategy="entropy"):
+    """候補の中から、次に試すべきコード番号を選ぶ（同点なら候補そのものを優先）"""
+    if len(candidates) <= 2:
+        return candidates[0]
+    candidate_set = set(candidates)
+    best = None
+    best_key = None
+    for guess in range(CODE_COUNT):
+        key = (score_guess(guess, candidates, strategy), guess in candidate_set)
+        if best_key is None or key > best_key:
+            best, best_key = guess, key
+    return best
+
+
+_memo = {}
+
+
+def next_guess(allow_duplicates, history, strategy="entropy"):
+    """
+    履歴から次の推測のコード番号を返す。
+    同じ履歴に対する答えは常に同じなのでメモしておき、2 回目以降は辞書を引くだけにする。
+    """
+    key = (allow_duplicates, strategy, tuple(history))
+    guess = _memo.get(key)
+    if guess is None:
+        candidates = candidates_from_log(allow_duplicates, history)
+        if not candidates:
+            return None
+        guess = best_guess(candidates, strategy)
+        if len(_memo) >= MEMO_LIMIT:
+            _memo.clear()
+        _memo[key] = guess
+    return guess
+
+
+def hint(allow_duplicates, history, strategy="entropy"):
+    """(残りの候補数, おすすめのコード文字列) を返す"""
+    candidates = candidates_from_log(allow_duplicates, history)
+    guess = next_guess(allow_duplicates, history, strategy)
+    return len(candidates), (decode(guess) if guess is not None else None)
@@ -0,0 +1,194 @@
+"""あっち向いてホイの記録と成績
+
+じゃんけんの手・指の向き・顔の向き・試合結果を 1 件 30 バイトの固定長レコードで
+ファイルの末尾に追記していく。record はメモリ上の待ち行列に積むだけで、
+ファイルへの書き込みは専用スレッドが GAME_STATE_FLUSH_MS ごとにまとめて行う。
+成績は起動後に一度だけログを読み直して作り、
+それ以降はイベントが来るたびに足し込むだけにする（!stats のたびにログを読み直さない）。
+
+    時刻(uint32) 種類(uint8) サーバーID(uint64) プレイヤーID(uint64) 相手ID(uint64) 値(uint8)
+"""
+
+import atexit
+import os
+import struct
+import threading
+import time
+from collections import Counter, deque
+from pathlib import Path
+
+from game_store import FLUSH_MS
+
+EVENT_LOG_PATH = Path(os.getenv("HOI_EVENT_LOG", Path(__file__).resolve().parent / "hoi_events.bin"))
+
+RECORD = struct.Struct("<IBQQQB")
+
+# イベントの種類
+THROW = 0   # じゃんけんの手（値: HANDS の番号）
+FINGER = 1  # 指の向き（値: DIRECTIONS の番号）
+FACE = 2    # 顔の向き（値: DIRECTIONS の番号）
+RESULT = 3  # 試合結果。プレイヤーが勝者、相手が敗者（値: HOW の番号）
+
+HANDS = ("グー", "チョキ", "パー")
+DIRECTIONS = ("上", "下", "左", "右")
+HOW = ("通常", "不戦勝", "抽選")
+
+# 直近の勝率を出すときの試合数
+RECENT_MATCHES = 20
+
+
+class EventLog:
+    """追記専用のイベントログ"""
+
+    def __init__(self, path, flush_ms=FLUSH_MS):
+        self.path = path
+        self.interval = flush_ms / 1000
+        self.pending = bytearray()
+        self.lock = threading.Lock()
+        # ファイルへの書き込みは書き込みスレッドと flush の呼び出し元のどちらかだけが行う
+        self.file_lock = threading.Lock()
+        self.wake = threading.Event()
+        self.closed = False
+        self.writer = None
+
+    def append(self, record):
+        with self.lock:
+            self.pending += record
+            if self.writer is None:
+                self.writer = threading.Thread(target=self.run, name="hoi-event-writer", daemon=True)
+                self.writer.start()
+
+    def flush(self):
+        with self.file_lock:
+            with self.lock:
+                batch, self.pending = self.pending, bytearray()
+            if batch:
+                with open(self.path, "ab") as f:
+                    f.write(batch)
+
+    def run(self):
+        while not self.closed:
+            self.wake.wait(self.interval)
+            self.flush()
+
+    def size(self):
+        """待ち行列を書き出したうえでのファイルの大きさ"""
+        self.flush()
+        return self.path.stat().st_size if self.path.exists() else 0
+
+    def read(self, size):
+        """先頭から size バイトまでをレコードごとに読む（書きかけの末尾は読み飛ばす）"""
+        if not size:
+            return
+        with open(self.path, "rb") as f:
+            data = f.read(size)
+        usable = len(data) - len(data) % RECORD.size
+        yield from RECORD.iter_unpack(memoryview(data)[:usable])
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.wake.set()
+        if self.writer is not None:
+            self.writer.join()
+        self.flush()
+
+
+class PlayerStats:
+    __slots__ = ("matches", "wins", "hands", "fingers", "faces", "recent")
+
+    def __init__(self):
+        self.matches = 0
+        self.wins = 0
+        self.hands = Counter()
+        self.fingers = Counter()
+        self.faces = Counter()
+        self.recent = deque(maxlen=RECENT_MATCHES)  # 直近の試合の勝ち負け
+
+    def win_rate(self):
+        return self.wins / self.matches if self.matches else 0.0
+
+    def recent_win_rate(self):
+        return sum(self.recent) / len(self.recent) if self.recent else 0.0
+
+
+class StatsAggregator:
+    """(サーバー ID, プレイヤー ID) ごとの成績をイベント 1 件ずつ更新する"""
+
+    def __init__(self):
+        self.players = {}
+
+    def stats(self, guild_id, player_id):
+        key = (guild_id, player_id)
+        stats = self.players.get(key)
+        if stats is None:
+            stats = self.players[key] = PlayerStats()
+        return stats
+
+    def apply(self, kind, guild_id, player_id, opponent_id, value):
+        if kind == THROW:
+            self.stats(guild_id, player_id).hands[value] += 1
+        elif kind == FINGER:
+            self.stats(guild_id, player_id).fingers[value] += 1
+        elif kind == FACE:
+            self.stats(guild_id, player_id).faces[value] += 1
+        elif kind == RESULT:
+            winner = self.stats(guild_id, player_id)
+            loser = self.stats(guild_id, opponent_id)
+            winner.matches += 1
+            winner.wins += 1
+            winner.recent.append(1)
+            loser.matches += 1
+            loser.recent.append(0)
+
+    def get(self, guild_id, player_id):
+        return self.players.get((guild_id, player_id))
+
+
+_log = EventLog(EVENT_LOG_PATH)
+atexit.register(_log.close)
+_aggregator = None
+_aggregator_lock = threading.Lock()
+# 読み直している間に記録されたイベント（読み直しが終わったら足し込む）
+_backlog = None
+_backlog_lock = threading.Lock()
+
+
+def get_aggregator():
+    """成績を（初回だけログを読み直して）返す。初回は重いのでイベントループの外から呼ぶ"""
+    global _aggregator, _backlog
+    if _aggregator is None:
+        with _aggregator_lock:
+            if _aggregator is None:
+                # ここまでに記録された分はファイルから、ここから後の分は _backlog から足し込む
+                with _backlog_lock:
+                    size = _log.size()
+                    _backlog = []
+                aggregator = StatsAggregator()
+                for _, *event in _log.read(size):
+                    aggregator.apply(*event)
+                with _backlog_lock:
+                    for event in _backlog:
+                        aggregator.apply(*event)
+                    _backlog = None
+                    _aggregator = aggregator
+    return _aggregator
+
+
+def record(kind, guild_id, player_id, opponent_id, value=0):
+    """イベントを 1 件記録する（書き込みを待たずにすぐ戻る）"""
+    with _backlog_lock:
+        _log.append(RECORD.pack(int(time.time()), kind, guild_id, player_id, opponent_id, value))
+        if _aggregator is not None:
+            _aggregator.apply(kind, guild_id, player_id, opponent_id, value)
+        elif _backlog is not None:
+            _backlog.append((kind, guild_id, player_id, opponent_id, value))
+
+
+def tendency(counter, names):
+    """'上 40% / 左 30% ...' のように多い順に並べる"""
+    total = sum(counter.values())
+    if not total:
+        return "なし"
+    return " / ".join(f"{names[value]} {count / total:.0%}" for value, count in counter.most_common())
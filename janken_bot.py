@@ -2,8 +2,12 @@ import discord
 from discord.ext import commands
 import random
 import asyncio
+from collections import Counter
 from dotenv import load_dotenv
 import os
+import struct
+from game_store import SavedGames, get_store
+from session_registry import LOBBY_TIMEOUT, sessions
 
 
 intents = discord.Intents.default()
@@ -12,76 +16,220 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 
 active_games = {}
 
+# 誰かが最初の手を出すまで待つ秒数
+ENTRY_SECONDS = 10
+# 最初の手が出てから締め切るまでの秒数（全員そろえばその時点で締め切る）
+ROUND_SECONDS = 5
+
+BEATS = {"グー": "チョキ", "チョキ": "パー", "パー": "グー"}
+HAND_EMOJIS = {"グー": "✊", "チョキ": "✌️", "パー": "🖐️"}
+
+# これより多い人数が手を出したら大人数モードにする
+#   名前を並べずに手ごとの人数だけを出し、1 人になるまで勝ち残りを続ける。
+#   3 種類の手がそろったときは、一番少ない手を出した人が勝ち残る。
+MASS_THRESHOLD = int(os.getenv("JANKEN_MASS_THRESHOLD", "20"))
+# 大人数モードで勝ち残った人の名前を出す人数の上限
+NAME_LIMIT = 10
+
+# 進行中のじゃんけんのスナップショット（再起動後の再開用）
+#   チャンネル ID、大人数モードか、手を出せる人が決まっているか、その人数 → その人の ID
+STATE_KIND = "janken"
+SNAPSHOT_HEADER = struct.Struct("<QBBI")
+PLAYER_ID = struct.Struct("<Q")
+
+def pack_session(session):
+    expected = session.expected or ()
+    parts = [SNAPSHOT_HEADER.pack(session.channel.id, session.mass, session.expected is not None, len(expected))]
+    parts.extend(PLAYER_ID.pack(user_id) for user_id in expected)
+    return b"".join(parts)
+
+def unpack_session(data, channel):
+    _, mass, has_expected, count = SNAPSHOT_HEADER.unpack_from(data)
+    session = GroupJankenSession(channel)
+    session.mass = bool(mass)
+    if has_expected:
+        ids = data[SNAPSHOT_HEADER.size:SNAPSHOT_HEADER.size + count * PLAYER_ID.size]
+        session.expected = {user_id for (user_id,) in PLAYER_ID.iter_unpack(ids)}
+    return session
+
+def end_session(guild_id):
+    active_games.pop(guild_id, None)
+    sessions.remove(STATE_KIND, guild_id)
+    get_store().delete(STATE_KIND, guild_id)
+
+async def expire_session(guild_id):
+    # 手が集まらないまま止まったじゃんけんでサーバーが使えなくならないように
+    session = active_games.get(guild_id)
+    if session:
+        end_session(guild_id)
+        session.cancel()
+        await session.ctx.send("⌛ 一定時間進行がなかったため、じゃんけんを終了しました。")
+
 class GroupJankenSession:
+    """
+    1 つのタスクがラウンドを順に回す。
+    1 回戦は誰でも参加でき、あいこのときはそのラウンドで手を出した人だけでやり直す。
+    """
+
     def __init__(self, ctx):
-        self.ctx = ctx
-        self.players = set()
+        self.ctx = ctx  # 再開したじゃんけんではコマンドの ctx の代わりにチャンネルが入る
+        self.channel = getattr(ctx, "channel", ctx)
         self.hands = {}
-        self.collecting = True
+        self.counts = Counter()  # 手ごとの人数（押されるたびに数える）
+        self.mass = False
+        self.expected = None  # このラウンドで手を出せる人の ID（None なら誰でも）
+        self.collecting = False
+        self.first_hand = asyncio.Event()
+        self.all_answered = asyncio.Event()
+        self.task = None
 
-    async def start(self):
-        await self.ctx.send("最初はグー✊じゃんけん～～\n手を選んでください：", view=GroupJankenView(self))
+    def start(self):
+        self.task = asyncio.create_task(self.run())
 
-    async def handle_hand(self, user, hand):
-        if not self.collecting:
-            return
-        if user.id in self.hands:
-            return
-        self.players.add(user)
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+
+    def handle_hand(self, user, hand):
+        """手を受け付けたら True"""
+        if not self.collecting or user.id in self.hands:
+            return False
+        if self.expected is not None and user.id not in self.expected:
+            return False
         self.hands[user.id] = (user, hand)
+        self.counts[hand] += 1
+        self.first_hand.set()
+        if self.expected is not None and len(self.hands) == len(self.expected):
+            self.all_answered.set()
+        return True
 
-    async def finalize(self):
-        self.collecting = False
-        if len(self.players) < 2:
-            await self.ctx.send("相手が見つかりませんでした。")
-            return
+    async def collect(self):
+        """最初の手から ROUND_SECONDS 秒たつか、全員の手がそろうまで待つ"""
+        try:
+            await asyncio.wait_for(self.first_hand.wait(), ENTRY_SECONDS)
+            await asyncio.wait_for(self.all_answered.wait(), ROUND_SECONDS)
+        except asyncio.TimeoutError:
+            pass
 
-        await self.ctx.send("🗣️ ポイ！")
-        results = [f"{user.display_name}：{hand}" for user, hand in self.hands.values()]
-        await self.ctx.send("\n".join(results))
+    async def play_round(self):
+        """1 ラウンド分の手を集める"""
+        if self.ctx.guild:
+            # ラウンドが進んでいる間は片付けの期限を延ばし、再起動してもこのラウンドから再開できるよう保存する
+            sessions.touch(STATE_KIND, self.ctx.guild.id, LOBBY_TIMEOUT, expire_session)
+            get_store().put(STATE_KIND, self.ctx.guild.id, pack_session(self))
+        self.hands = {}
+        self.counts = Counter()
+        self.first_hand.clear()
+        self.all_answered.clear()
+        self.collecting = True
+        view = GroupJankenView(self)
+        await self.ctx.send("最初はグー✊じゃんけん～～\n手を選んでください：", view=view)
+        try:
+            await self.collect()
+        finally:
+            self.collecting = False
+            view.stop()
 
-        hands_list = [hand for _, hand in self.hands.values()]
-        unique = set(hands_list)
-        if len(unique) == 1 or len(unique) == 3:
+    async def run(self):
+        cancelled = False
+        try:
+            while True:
+                await self.play_round()
+                if not await self.judge():
+                    break
+                await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # 途中で失敗しても、サーバーがじゃんけん中のまま固まらないようにする
+            # （中断されたとき＝片付けか Bot の終了のときは、再開できるよう保存を残す）
+            if not cancelled and self.ctx.guild and active_games.get(self.ctx.guild.id) is self:
+                end_session(self.ctx.guild.id)
+
+    def winning_hands(self):
+        """勝ち残る手の集合（あいこなら None）"""
+        present = [hand for hand in BEATS if self.counts[hand]]
+        if len(present) == 2:
+            a, b = present
+            return {a} if BEATS[a] == b else {b}
+        if len(present) == 3 and self.mass:
+            fewest = min(self.counts[hand] for hand in present)
+            survivors = {hand for hand in present if self.counts[hand] == fewest}
+            if len(survivors) < 3:
+                return survivors
+        return None
+
+    def summary(self):
+        """手ごとの人数だけをまとめた 1 行"""
+        return " / ".join(f"{HAND_EMOJIS[hand]} {hand} {self.counts[hand]}人" for hand in BEATS)
+
+    async def judge(self):
+        """結果を送る。次のラウンドに進むときは True（次に手を出せる人は self.expected）"""
+        if len(self.hands) < 2:
+            if self.expected is not None and self.hands:
+                # あいこの後で手を出したのが 1 人だけなら、その人の勝ち
+                (user, hand), = self.hands.values()
+                await self.ctx.send(f"🎉 勝者: {user.mention}（{hand}）🎉")
+            else:
+                await self.ctx.send("相手が見つかりませんでした。")
+            return False
+
+        if len(self.hands) > MASS_THRESHOLD:
+            self.mass = True
+
+        if self.mass:
+            await self.ctx.send(f"🗣️ ポイ！（{len(self.hands)}人）\n{self.summary()}")
+        else:
+            results = [f"{user.display_name}：{hand}" for user, hand in self.hands.values()]
+            await self.ctx.send("🗣️ ポイ！\n" + "\n".join(results))
+
+        winning = self.winning_hands()
+        if winning is None:
+            # あいこ：手を出した人だけで次のラウンドへ
             await self.ctx.send("🌀 あいこで～～")
-            await asyncio.sleep(1)
-            await self.start()
-            return
+            self.expected = set(self.hands)
+            return True
 
-        beats = {"グー": "チョキ", "チョキ": "パー", "パー": "グー"}
-        winner_hand = None
-        for h in unique:
-            if all(beats[h] == oh for oh in unique if oh != h):
-                winner_hand = h
-                break
+        winners = [user for user, hand in self.hands.values() if hand in winning]
+        winner_hand = "・".join(hand for hand in BEATS if hand in winning)
+        if self.mass and len(winners) > 1:
+            # 大人数モードは 1 人になるまで勝ち残った人だけで続ける
+            names = "\n" + ", ".join(user.mention for user in winners) if len(winners) <= NAME_LIMIT else ""
+            await self.ctx.send(f"✨ {winner_hand} の勝ち！ 残り {len(winners)} 人で続けます{names}")
+            self.expected = {user.id for user in winners}
+            return True
 
-        winners = [user for user, hand in self.hands.values() if hand == winner_hand]
         names = ', '.join(user.mention for user in winners)
         await self.ctx.send(f"🎉 勝者: {names}（{winner_hand}）🎉")
-
-        if self.ctx.guild:
-            del active_games[self.ctx.guild.id]
+        return False
 
 class GroupJankenView(discord.ui.View):
-    def __init__(self, session):
-        super().__init__(timeout=10)
+    """
+    ボタンには固定の custom_id を付け、session なしで作ったものを永続ビューとして登録しておく。
+    再起動後に古いメッセージのボタンが押されたときは、そのサーバーのじゃんけんに渡す。
+    """
+
+    def __init__(self, session=None):
+        super().__init__(timeout=ENTRY_SECONDS + ROUND_SECONDS if session else None)
         self.session = session
-        self.timer_started = False
 
     async def handle(self, interaction, hand):
-        await self.session.handle_hand(interaction.user, hand)
-        await interaction.response.send_message(f"{hand} を選びました！", ephemeral=True)
-
-        if not self.timer_started:
-            self.timer_started = True
-            await asyncio.sleep(5)
-            await self.session.finalize()
+        session = self.session or active_games.get(interaction.guild_id)
+        if session and interaction.channel_id != session.channel.id:
+            # 同じサーバーの別のチャンネルに残っていた古いボタン
+            await interaction.response.send_message("このじゃんけんはもう終わっています。", ephemeral=True)
+            return
+        if session and session.handle_hand(interaction.user, hand):
+            await interaction.response.send_message(f"{hand} を選びました！", ephemeral=True)
+        else:
+            await interaction.response.send_message("このラウンドでは手を選べません。", ephemeral=True)
 
-    @discord.ui.button(label="グー ✊", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="グー ✊", style=discord.ButtonStyle.primary, custom_id="janken:g")
     async def g(self, i, b): await self.handle(i, "グー")
-    @discord.ui.button(label="チョキ ✌️", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="チョキ ✌️", style=discord.ButtonStyle.primary, custom_id="janken:c")
     async def c(self, i, b): await self.handle(i, "チョキ")
-    @discord.ui.button(label="パー 🖐️", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="パー 🖐️", style=discord.ButtonStyle.primary, custom_id="janken:p")
     async def p(self, i, b): await self.handle(i, "パー")
 
 @bot.command(name="j")
@@ -91,10 +239,38 @@ async def j(ctx):
         return
     session = GroupJankenSession(ctx)
     if ctx.guild:
-        active_games[ctx.guild.id] = True
-    await session.start()
+        active_games[ctx.guild.id] = session
+        sessions.touch(STATE_KIND, ctx.guild.id, LOBBY_TIMEOUT, expire_session)
+    session.start()
+
+async def restore_session(guild_id, data, channel):
+    """保存されていたじゃんけんを読み戻し、途中のラウンドからやり直す"""
+    session = active_games[guild_id] = unpack_session(data, channel)
+    await channel.send("🔄 Bot が再起動したため、じゃんけんを再開します。")
+    session.start()
+
+saved_games = SavedGames(STATE_KIND, active_games, restore_session)
 
+@bot.listen("on_ready")
+async def restore_once():
+    await saved_games.restore_once(bot)
+
+def persistent_views():
+    """再起動前に送ったボタンを受け付けるための永続ビュー（setup_hook で登録する）"""
+    return [GroupJankenView()]
+
+@bot.event
+async def setup_hook():
+    for view in persistent_views():
+        bot.add_view(view)
+
+async def setup(host):
+    global bot
+    host.adopt(bot, listeners=[(restore_once, "on_ready")], views=persistent_views())
+    bot = host
 
 # 起動処理
-load_dotenv()
-bot.run(os.getenv("DISCORD_TOKEN")) 
+if __name__ == "__main__":
+    load_dotenv()
+    bot.run(os.getenv("DISCORD_TOKEN"))
+
@@ -4,6 +4,10 @@ import random
 import asyncio
 from dotenv import load_dotenv
 import os
+import struct
+from game_store import SavedGames, get_store, resolve_user
+from session_registry import sessions
+import hoi_stats
 
 
 intents = discord.Intents.default()
@@ -12,34 +16,176 @@ bot = commands.Bot(command_prefix="!", intents=intents)
 
 active_tournaments = {}
 
+# 試合ごとにスレッドを作って、同じラウンドの試合を並行して進める（作れなければ元のチャンネルで行う）
+MATCH_THREADS = os.getenv("HOI_MATCH_THREADS", "1") == "1"
+
+# 各段階の締め切り（秒）
+JANKEN_SECONDS = 60
+DIRECTION_SECONDS = 30
+PHASE_SECONDS = {"janken": JANKEN_SECONDS, "finger": DIRECTION_SECONDS, "face": DIRECTION_SECONDS}
+# どの試合もこの秒数進まなければ、止まったトーナメントとして片付ける
+STALL_TIMEOUT = float(os.getenv("HOI_STALL_TIMEOUT", "300"))
+
+DIRECTIONS = ("上", "下", "左", "右")
+
+def end_tournament(guild_id):
+    active_tournaments.pop(guild_id, None)
+    sessions.remove("tournament", guild_id)
+    get_store().delete(STATE_KIND, guild_id)
+
+def keep_alive(guild_id):
+    """トーナメントが進んだことを記録して、片付けの期限を延ばす"""
+    if guild_id in active_tournaments:
+        sessions.touch("tournament", guild_id, STALL_TIMEOUT, expire_tournament)
+
+async def expire_tournament(guild_id):
+    """試合が進まなくなったトーナメントを片付ける"""
+    tournament = active_tournaments.get(guild_id)
+    if tournament:
+        end_tournament(guild_id)
+        tournament.cancel()
+        await tournament.channel.send("一定時間進行がなかったため、トーナメントを終了しました。")
+
+def pair_players(players):
+    """[(p1, p2), ...] と、奇数人のときに不戦勝になる最後の 1 人（いなければ None）"""
+    pairs = [(players[i], players[i + 1]) for i in range(0, len(players) - 1, 2)]
+    bye = players[-1] if len(players) % 2 else None
+    return pairs, bye
+
+# 進行中のトーナメントのスナップショット（再起動後の再開用）
+#   チャンネル ID、何回戦目か、このラウンドに残っている人数
+#   → 残っている人の ID（組み合わせの順）→ 試合ごとに (試合用のチャンネル ID, 勝者の ID)（まだなら 0）
+STATE_KIND = "tournament"
+SNAPSHOT_HEADER = struct.Struct("<QHH")
+PLAYER_ID = struct.Struct("<Q")
+MATCH_ENTRY = struct.Struct("<QQ")
+
+def pack_tournament(tournament):
+    pairs, _ = pair_players(tournament.players)
+    parts = [SNAPSHOT_HEADER.pack(tournament.channel.id, tournament.round, len(tournament.players))]
+    parts.extend(PLAYER_ID.pack(player.id) for player in tournament.players)
+    for index in range(len(pairs)):
+        winner = tournament.results.get(index)
+        parts.append(MATCH_ENTRY.pack(tournament.match_channels.get(index, 0), winner.id if winner else 0))
+    return b"".join(parts)
+
+async def unpack_tournament(data, channel):
+    _, round_number, player_count = SNAPSHOT_HEADER.unpack_from(data)
+    offset = SNAPSHOT_HEADER.size
+    players = []
+    for _ in range(player_count):
+        (player_id,) = PLAYER_ID.unpack_from(data, offset)
+        players.append(await resolve_user(bot, player_id))
+        offset += PLAYER_ID.size
+
+    tournament = TournamentState(channel, players, round_number)
+    by_id = {player.id: player for player in players}
+    for index, (channel_id, winner_id) in enumerate(MATCH_ENTRY.iter_unpack(data[offset:])):
+        if channel_id:
+            tournament.match_channels[index] = channel_id
+        if winner_id:
+            tournament.results[index] = by_id[winner_id]
+    return tournament
+
 class JankenHouiSession:
-    def __init__(self, ctx, player1, player2):
-        self.ctx = ctx
+    """
+    1 試合分。channel は試合用のスレッドか、トーナメントのチャンネル。
+    じゃんけん → 指 → 顔 の各段階に締め切りがあり、時間切れのときは
+    じゃんけんは不戦勝（どちらも出さなければ抽選）、指と顔の向きはランダムで決めて先に進める。
+    締め切りは段階ごとのタイマーで測る（ボタンを押されても延びない）。
+    """
+
+    def __init__(self, channel, player1, player2):
+        self.channel = channel
+        self.guild_id = channel.guild.id
         self.player1 = player1
         self.player2 = player2
         self.hands = {}
         self.winner = None
         self.loser = None
         self.finger_direction = None
+        self.phase = None
+        self.step = 0  # 段階が進むたびに増やし、前の段階の締め切りを無視する
+        self.deadline = None  # 今の段階の締め切りを待つタスク
+        # 勝者が決まったら結果が入る
+        self.result = asyncio.get_running_loop().create_future()
+
+    def next_step(self, phase):
+        self.phase = phase
+        self.step += 1
+        self.cancel_deadline()
+        self.deadline = asyncio.create_task(self.phase_deadline(self.step, phase))
+        # 試合が進んでいる間はトーナメントを止まっているとみなさない
+        keep_alive(self.guild_id)
+        return self.step
+
+    def cancel_deadline(self):
+        # 締め切りの処理そのものから次の段階に進んだときは、自分を止めない
+        if self.deadline and self.deadline is not asyncio.current_task():
+            self.deadline.cancel()
+        self.deadline = None
+
+    async def phase_deadline(self, step, phase):
+        await asyncio.sleep(PHASE_SECONDS[phase])
+        # 先に進んでいれば何もしない
+        if self.step != step or self.phase != phase:
+            return
+        if phase == "janken":
+            await self.janken_timeout()
+        else:
+            await self.direction_timeout(phase)
+
+    def record(self, kind, player, opponent, value=0):
+        hoi_stats.record(kind, self.guild_id, player.id, opponent.id, value)
+
+    def finish(self, winner, how=0):
+        """how は hoi_stats.HOW の番号（通常・不戦勝・抽選）"""
+        self.phase = "done"
+        self.cancel_deadline()
+        if not self.result.done():
+            loser = self.player2 if winner == self.player1 else self.player1
+            self.record(hoi_stats.RESULT, winner, loser, how)
+            self.result.set_result(winner)
 
     async def start(self):
         self.hands.clear()
-        await self.ctx.send(f"🧤 {self.player1.mention} vs {self.player2.mention}\n最初はグー✊じゃんけん～～：", view=JankenView(self))
+        self.next_step("janken")
+        await self.channel.send(f"🧤 {self.player1.mention} vs {self.player2.mention}\n最初はグー✊じゃんけん～～：", view=JankenView(self))
 
     async def handle_hand(self, user, hand):
+        if self.phase != "janken":
+            return
         self.hands[user.id] = hand
         if len(self.hands) == 2:
             await self.resolve_janken()
 
+    async def janken_timeout(self):
+        """じゃんけんの締め切り。出した人の不戦勝、どちらも出さなければ抽選"""
+        players = [self.player1, self.player2]
+        chosen = [player for player in players if player.id in self.hands]
+        if len(chosen) == 1:
+            winner = chosen[0]
+            absent = self.player2 if winner == self.player1 else self.player1
+            await self.channel.send(f"⌛ 時間切れ！{absent.display_name} さんが手を出さなかったため、{winner.display_name} さんの不戦勝です。")
+            how = 1
+        else:
+            winner = random.choice(players)
+            await self.channel.send(f"⌛ 時間切れ！どちらも手を出さなかったため、抽選で {winner.display_name} さんが勝ち上がります。")
+            how = 2
+        self.finish(winner, how)
+
     async def resolve_janken(self):
         p1_hand = self.hands[self.player1.id]
         p2_hand = self.hands[self.player2.id]
         beats = {"グー": "チョキ", "チョキ": "パー", "パー": "グー"}
+        self.phase = None  # 結果を出している間は手を受け付けない
+        self.record(hoi_stats.THROW, self.player1, self.player2, hoi_stats.HANDS.index(p1_hand))
+        self.record(hoi_stats.THROW, self.player2, self.player1, hoi_stats.HANDS.index(p2_hand))
 
-        await self.ctx.send(f"{self.player1.display_name}: {p1_hand} vs {self.player2.display_name}: {p2_hand}")
+        await self.channel.send(f"{self.player1.display_name}: {p1_hand} vs {self.player2.display_name}: {p2_hand}")
 
         if p1_hand == p2_hand:
-            await self.ctx.send("🌀 あいこで～～ ")
+            await self.channel.send("🌀 あいこで～～ ")
             await self.start()
             return
 
@@ -53,95 +199,151 @@ class JankenHouiSession:
         await self.ask_finger_direction()
 
     async def ask_finger_direction(self):
-        await self.ctx.send(f"👉 {self.winner.mention} さん、指の方向を選んでください：", view=FingerView(self))
+        self.next_step("finger")
+        await self.channel.send(f"👉 {self.winner.mention} さん、指の方向を選んでください：", view=FingerView(self))
 
-    async def handle_finger(self, user, direction):
-        if user != self.winner:
+    async def handle_finger(self, user, direction, chosen=True):
+        """chosen=False は時間切れでランダムに決めた向き（成績には数えない）"""
+        if self.phase != "finger" or user != self.winner:
             return
         self.finger_direction = direction
+        if chosen:
+            self.record(hoi_stats.FINGER, self.winner, self.loser, hoi_stats.DIRECTIONS.index(direction))
         await self.ask_face_direction()
 
     async def ask_face_direction(self):
-        await self.ctx.send(f"😳 {self.loser.mention} さん、顔の向きを選んでください：", view=FaceView(self))
+        self.next_step("face")
+        await self.channel.send(f"😳 {self.loser.mention} さん、顔の向きを選んでください：", view=FaceView(self))
 
-    async def handle_face(self, user, direction):
-        if user != self.loser:
+    async def handle_face(self, user, direction, chosen=True):
+        """chosen=False は時間切れでランダムに決めた向き（成績には数えない）"""
+        if self.phase != "face" or user != self.loser:
             return
+        self.phase = None
+        if chosen:
+            self.record(hoi_stats.FACE, self.loser, self.winner, hoi_stats.DIRECTIONS.index(direction))
         if direction == self.finger_direction:
-            await self.ctx.send(f"🎯 一致！{self.winner.display_name} さんの勝利！")
-            self.ctx.bot.dispatch("tournament_win", self.ctx.guild.id, self.winner)
+            await self.channel.send(f"🎯 一致！{self.winner.display_name} さんの勝利！")
+            self.finish(self.winner)
         else:
-            await self.ctx.send(f"😆 指: {self.finger_direction} vs 顔: {direction} → 不一致！再戦します！")
+            await self.channel.send(f"😆 指: {self.finger_direction} vs 顔: {direction} → 不一致！再戦します！")
             await self.start()
 
-class JankenView(discord.ui.View):
-    def __init__(self, session):
-        super().__init__(timeout=60)
+    async def direction_timeout(self, phase):
+        """指・顔の向きの締め切り。ランダムな向きを選んだことにして進める"""
+        direction = random.choice(DIRECTIONS)
+        if phase == "finger":
+            await self.channel.send(f"⌛ 時間切れ！{self.winner.display_name} さんの指はランダムで {direction} になりました。")
+            await self.handle_finger(self.winner, direction, chosen=False)
+        else:
+            await self.channel.send(f"⌛ 時間切れ！{self.loser.display_name} さんの顔はランダムで {direction} になりました。")
+            await self.handle_face(self.loser, direction, chosen=False)
+
+class PhaseView(discord.ui.View):
+    """
+    試合の 1 段階分のボタン（締め切りは試合側のタイマーが受け持つ）。
+    ボタンには固定の custom_id を付け、session なしで作ったものを永続ビューとして登録しておく。
+    再起動後に古いメッセージのボタンが押されたときは、押した人の試合を探して渡す。
+    """
+
+    def __init__(self, session=None):
+        super().__init__(timeout=PHASE_SECONDS[session.phase] if session else None)
         self.session = session
 
+    def find_session(self, interaction):
+        if self.session is not None:
+            return self.session
+        tournament = active_tournaments.get(interaction.guild_id)
+        session = tournament.match_for(interaction.user.id) if tournament else None
+        # 別のチャンネル（前の試合のスレッドなど）に残っていた古いボタンは受け付けない
+        if session and interaction.channel_id != session.channel.id:
+            return None
+        return session
+
+class JankenView(PhaseView):
     async def handle(self, interaction, hand):
-        if interaction.user.id not in [self.session.player1.id, self.session.player2.id]:
+        session = self.find_session(interaction)
+        if session is None or interaction.user.id not in [session.player1.id, session.player2.id]:
             await interaction.response.send_message("この試合には参加していません。", ephemeral=True)
             return
         await interaction.response.send_message(f"{hand} を選びました。", ephemeral=True)
-        await self.session.handle_hand(interaction.user, hand)
+        await session.handle_hand(interaction.user, hand)
 
-    @discord.ui.button(label="グー ✊", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="グー ✊", style=discord.ButtonStyle.primary, custom_id="hoi:hand:g")
     async def g(self, i, b): await self.handle(i, "グー")
-    @discord.ui.button(label="チョキ ✌️", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="チョキ ✌️", style=discord.ButtonStyle.primary, custom_id="hoi:hand:c")
     async def c(self, i, b): await self.handle(i, "チョキ")
-    @discord.ui.button(label="パー 🖐️", style=discord.ButtonStyle.primary)
+    @discord.ui.button(label="パー 🖐️", style=discord.ButtonStyle.primary, custom_id="hoi:hand:p")
     async def p(self, i, b): await self.handle(i, "パー")
 
-class FingerView(discord.ui.View):
-    def __init__(self, session):
-        super().__init__(timeout=30)
-        self.session = session
-
+class FingerView(PhaseView):
     async def handle(self, interaction, direction):
-        if interaction.user != self.session.winner:
+        session = self.find_session(interaction)
+        if session is None or interaction.user != session.winner:
             await interaction.response.send_message("あなたは指を決める側ではありません。", ephemeral=True)
             return
         await interaction.response.send_message(f"{direction} を選びました。", ephemeral=True)
-        await self.session.handle_finger(interaction.user, direction)
+        await session.handle_finger(interaction.user, direction)
 
-    @discord.ui.button(label="↑ 上", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="↑ 上", style=discord.ButtonStyle.secondary, custom_id="hoi:finger:up")
     async def up(self, i, b): await self.handle(i, "上")
-    @discord.ui.button(label="↓ 下", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="↓ 下", style=discord.ButtonStyle.secondary, custom_id="hoi:finger:down")
     async def down(self, i, b): await self.handle(i, "下")
-    @discord.ui.button(label="← 左", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="← 左", style=discord.ButtonStyle.secondary, custom_id="hoi:finger:left")
     async def left(self, i, b): await self.handle(i, "左")
-    @discord.ui.button(label="→ 右", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="→ 右", style=discord.ButtonStyle.secondary, custom_id="hoi:finger:right")
     async def right(self, i, b): await self.handle(i, "右")
 
-class FaceView(discord.ui.View):
-    def __init__(self, session):
-        super().__init__(timeout=30)
-        self.session = session
-
+class FaceView(PhaseView):
     async def handle(self, interaction, direction):
-        if interaction.user != self.session.loser:
+        session = self.find_session(interaction)
+        if session is None or interaction.user != session.loser:
             await interaction.response.send_message("あなたは顔の向きを決める側ではありません。", ephemeral=True)
             return
         await interaction.response.send_message(f"{direction} を選びました。", ephemeral=True)
-        await self.session.handle_face(interaction.user, direction)
+        await session.handle_face(interaction.user, direction)
 
-    @discord.ui.button(label="↑ 上", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="↑ 上", style=discord.ButtonStyle.secondary, custom_id="hoi:face:up")
     async def up(self, i, b): await self.handle(i, "上")
-    @discord.ui.button(label="↓ 下", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="↓ 下", style=discord.ButtonStyle.secondary, custom_id="hoi:face:down")
     async def down(self, i, b): await self.handle(i, "下")
-    @discord.ui.button(label="← 左", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="← 左", style=discord.ButtonStyle.secondary, custom_id="hoi:face:left")
     async def left(self, i, b): await self.handle(i, "左")
-    @discord.ui.button(label="→ 右", style=discord.ButtonStyle.secondary)
+    @discord.ui.button(label="→ 右", style=discord.ButtonStyle.secondary, custom_id="hoi:face:right")
     async def right(self, i, b): await self.handle(i, "右")
 
+def persistent_views():
+    """再起動前に送ったボタンを受け付けるための永続ビュー（setup_hook で登録する）"""
+    return [JankenView(), FingerView(), FaceView()]
+
 @bot.command(name="h")
+@commands.guild_only()
 async def h(ctx):
     if ctx.guild.id in active_tournaments:
         await ctx.send("すでにトーナメントが開催されています！")
         return
     await ctx.send("🎮 【トーナメント制】あっち向いてホイの参加者募集！参加者は下のボタンを押してください！", view=EntryView(ctx))
 
+@bot.command(name="stats")
+@commands.guild_only()
+async def stats(ctx, member: discord.Member = None):
+    """あっち向いてホイの成績（指定がなければ自分）"""
+    member = member or ctx.author
+    # 初回はログを読み直すので、イベントループの外で行う
+    aggregator = await asyncio.to_thread(hoi_stats.get_aggregator)
+    player = aggregator.get(ctx.guild.id, member.id)
+    if player is None or not (player.matches or player.hands):
+        await ctx.send(f"{member.display_name} さんの記録はまだありません。")
+        return
+    await ctx.send("\n".join([
+        f"📊 **{member.display_name} さんの成績**",
+        f"試合: {player.matches}（{player.wins} 勝）勝率 {player.win_rate():.0%}"
+        f" / 直近 {len(player.recent)} 試合 {player.recent_win_rate():.0%}",
+        f"じゃんけん: {hoi_stats.tendency(player.hands, hoi_stats.HANDS)}",
+        f"指の向き: {hoi_stats.tendency(player.fingers, hoi_stats.DIRECTIONS)}",
+        f"顔の向き: {hoi_stats.tendency(player.faces, hoi_stats.DIRECTIONS)}",
+    ]))
+
 class EntryView(discord.ui.View):
     def __init__(self, ctx):
         super().__init__(timeout=5)
@@ -159,34 +361,144 @@ class EntryView(discord.ui.View):
             return
         shuffled = list(self.entries)
         random.shuffle(shuffled)
-        active_tournaments[self.ctx.guild.id] = TournamentState(self.ctx, shuffled)
-        await active_tournaments[self.ctx.guild.id].run_next_match()
+        tournament = active_tournaments[self.ctx.guild.id] = TournamentState(self.ctx.channel, shuffled)
+        tournament.start()
 
 class TournamentState:
-    def __init__(self, ctx, players):
-        self.ctx = ctx
-        self.players = players
+    """
+    1 ラウンドの試合をすべて同時に始め、全試合の勝者がそろったら次のラウンドへ進む。
+    N 人なら log2(N) ラウンドで終わる。
+    ラウンドの始めと試合が終わるたびに保存し、再起動後は同じラウンドの決着していない試合からやり直す。
+    """
+
+    def __init__(self, channel, players, round_number=1):
+        self.channel = channel
+        self.guild_id = self.channel.guild.id
+        self.players = players  # このラウンドに残っている人（並び順がそのまま組み合わせになる）
+        self.round = round_number
+        self.results = {}  # このラウンドの試合番号 → 勝者
+        self.match_channels = {}  # このラウンドの試合番号 → 試合用のチャンネル ID
+        self.matches = []  # これまでの試合
+        self.task = None
+
+    def start(self):
+        self.task = asyncio.create_task(self.run())
+
+    def cancel(self):
+        if self.task:
+            self.task.cancel()
+
+    def save(self):
+        """今のラウンドの状態を保存する（書き込みはまとめて別スレッドで行われる）"""
+        get_store().put(STATE_KIND, self.guild_id, pack_tournament(self))
+
+    def match_for(self, user_id):
+        """user_id が出ている決着前の試合"""
+        for match in reversed(self.matches):
+            if match.phase != "done" and user_id in (match.player1.id, match.player2.id):
+                return match
+        return None
+
+    async def run(self):
+        cancelled = False
+        try:
+            while len(self.players) > 1:
+                keep_alive(self.guild_id)
+                pairs, bye = pair_players(self.players)
+                self.save()
+                await self.announce_round(pairs, bye)
+                winners = await asyncio.gather(*(self.play_match(index, p1, p2) for index, (p1, p2) in enumerate(pairs)))
+                # 不戦勝の人は次のラウンドの先頭に置き、続けて不戦勝にならないようにする
+                self.players = ([bye] if bye else []) + list(winners)
+                self.round += 1
+                self.results = {}
+                self.match_channels = {}
+            await self.channel.send(f"🏆 優勝者は {self.players[0].mention} さんです！おめでとうございます！")
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # 残っている試合の締め切りのタイマーが後から時間切れ処理をしないようにする
+            for match in self.matches:
+                match.phase = "done"
+                match.cancel_deadline()
+            # 途中で失敗しても、サーバーがトーナメント中のまま固まらないようにする
+            # （中断されたとき＝片付けか Bot の終了のときは、再開できるよう保存を残す）
+            if not cancelled and active_tournaments.get(self.guild_id) is self:
+                end_tournament(self.guild_id)
+
+    async def announce_round(self, pairs, bye):
+        lines = [f"📣 **第{self.round}回戦**（{len(pairs)}試合）"]
+        for index, (p1, p2) in enumerate(pairs):
+            winner = self.results.get(index)
+            lines.append(f"・{p1.display_name} vs {p2.display_name}" + (f" → {winner.display_name} さんの勝ち" if winner else ""))
+        if bye:
+            lines.append(f"・{bye.display_name} さんは不戦勝です")
+        await self.channel.send("\n".join(lines))
+
+    async def match_channel(self, index, player1, player2):
+        """試合用のスレッドを作る（再開した試合は前と同じスレッド。作れなければトーナメントのチャンネル）"""
+        channel_id = self.match_channels.get(index)
+        if channel_id:
+            channel = bot.get_channel(channel_id)
+            if channel is not None:
+                return channel
+        channel = self.channel
+        if MATCH_THREADS and isinstance(self.channel, discord.TextChannel):
+            try:
+                channel = await self.channel.create_thread(
+                    name=f"{player1.display_name} vs {player2.display_name}",
+                    type=discord.ChannelType.public_thread,
+                    auto_archive_duration=60,
+                )
+            except discord.HTTPException:
+                pass
+        self.match_channels[index] = channel.id
+        return channel
+
+    async def play_match(self, index, player1, player2):
+        """1 試合を行って勝者を返す（再開前に決着していればその勝者）"""
+        if index in self.results:
+            return self.results[index]
+        channel = await self.match_channel(index, player1, player2)
+        session = JankenHouiSession(channel, player1, player2)
+        self.matches.append(session)
+        self.save()
+        await session.start()
+        winner = self.results[index] = await session.result
+        self.save()
+        if channel is not self.channel:
+            await self.channel.send(f"✅ {player1.display_name} vs {player2.display_name} → {winner.display_name} さんの勝ち")
+        return winner
+
+async def restore_tournament(guild_id, data, channel):
+    """保存されていたトーナメントを読み戻し、決着していない試合からやり直す"""
+    tournament = active_tournaments[guild_id] = await unpack_tournament(data, channel)
+    await channel.send("🔄 Bot が再起動したため、トーナメントを再開します。決着していない試合はじゃんけんからやり直しです。")
+    tournament.start()
+
+saved_games = SavedGames(STATE_KIND, active_tournaments, restore_tournament)
+
+@bot.listen("on_ready")
+async def restore_once():
+    await saved_games.restore_once(bot)
 
-    async def run_next_match(self):
-        if len(self.players) == 1:
-            await self.ctx.send(f"🏆 優勝者は {self.players[0].mention} さんです！おめでとうございます！")
-            del active_tournaments[self.ctx.guild.id]
-            return
-        player1 = self.players.pop(0)
-        player2 = self.players.pop(0)
-        self.session = JankenHouiSession(self.ctx, player1, player2)
-        await self.session.start()
+@bot.event
+async def setup_hook():
+    for view in persistent_views():
+        bot.add_view(view)
 
-    def winner_advance(self, winner):
-        self.players.append(winner)
+def warm_up():
+    """成績のログを先に読み込んでおく"""
+    hoi_stats.get_aggregator()
 
-@bot.event
-async def on_tournament_win(guild_id, winner):
-    tournament = active_tournaments.get(guild_id)
-    if tournament:
-        tournament.winner_advance(winner)
-        await tournament.run_next_match()
+async def setup(host):
+    global bot
+    host.adopt(bot, listeners=[(restore_once, "on_ready")], views=persistent_views())
+    bot = host
 
 # 起動処理
-load_dotenv()
-bot.run(os.getenv("DISCORD_TOKEN"))
+if __name__ == "__main__":
+    load_dotenv()
+    warm_up()
+    bot.run(os.getenv("DISCORD_TOKEN"))
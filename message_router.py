@@ -0,0 +1,46 @@
+"""メッセージの振り分け
+
+ゲームが進行中のチャンネルだけを表に持ち、そのチャンネルのメッセージだけを
+ゲームごとの入力ハンドラに渡す。ほかのチャンネルの雑談は辞書を 1 回引くだけで捨てる。
+コマンド（プレフィックスで始まるもの）だけを process_commands に回す。
+"""
+
+
+class MessageRouter:
+    def __init__(self):
+        # チャンネル ID → {ゲームの種類: ハンドラ}
+        self.routes = {}
+
+    def add(self, channel_id, kind, handler):
+        self.routes.setdefault(channel_id, {})[kind] = handler
+
+    def discard(self, channel_id, kind):
+        handlers = self.routes.get(channel_id)
+        if handlers is not None:
+            handlers.pop(kind, None)
+            if not handlers:
+                del self.routes[channel_id]
+
+    @property
+    def active_channels(self):
+        return self.routes.keys()
+
+    async def dispatch(self, message):
+        handlers = self.routes.get(message.channel.id)
+        if not handlers:
+            return
+        for handler in list(handlers.values()):
+            await handler(message)
+
+
+router = MessageRouter()
+
+
+async def route_message(bot, message):
+    """on_message から呼ぶ。コマンドはコマンドとして処理し、それ以外はゲームのあるチャンネルのものだけを渡す"""
+    if message.author.bot:
+        return
+    if message.content.startswith(bot.command_prefix):
+        await bot.process_commands(message)
+    else:
+        await router.dispatch(message)
@@ -4,9 +4,20 @@ from discord.ui import Button, View
 import os
 import random
 from dotenv import load_dotenv
-from PIL import Image
 import asyncio
-from pathlib import Path
+import re
+import struct
+from io import BytesIO
+from osero_board import (
+    BLACK, WHITE, SIZE, OseroBoard,
+    bit_index, index_to_xy, iter_bits,
+)
+from osero_render import IMAGE_FILENAME, BoardRenderer, board_key, get_sprites, render_board, render_cache
+from osero_ai import DEFAULT_LEVEL, LEVELS, choose_move, get_book
+from worker_pool import render_pool, search_pool
+from game_store import SavedGames, get_store, key_channel_id
+from session_registry import IDLE_TIMEOUT, LOBBY_TIMEOUT, sessions
+from message_router import route_message, router
 
 load_dotenv()
 TOKEN = os.getenv("DISCORD_TOKEN")
@@ -14,275 +25,170 @@ TOKEN = os.getenv("DISCORD_TOKEN")
 intents = discord.Intents.default()
 intents.message_content = True
 bot = commands.Bot(command_prefix="!", intents=intents)
-IMAGE_DIR = Path(__file__).resolve().parent / "image"
 
-EMPTY = "🟩"
-BLACK = "⚫"
-WHITE = "⚪"
-SIZE = 6
-
-DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1),
-              (0, -1),          (0, 1),
-              (1, -1),  (1, 0), (1, 1)]
+games = {}
 
-GFX_BACKGROUND = IMAGE_DIR / "osero_bord.png"
-GFX_BLACK      = IMAGE_DIR / "osero_black.png"
-GFX_WHITE      = IMAGE_DIR / "osero_white.png"
+# 1 人あたりの上書き可能回数
+OVERRIDE_LIMIT = 10
 
-games = {}
+# 'D3' のような座標の入力（前後の空白と大文字・小文字は問わない）
+MOVE_PATTERN = re.compile(r"\s*([A-H])(\d+)\s*", re.IGNORECASE)
 
 def create_board():
-    board = [[EMPTY for _ in range(SIZE)] for _ in range(SIZE)]
-    board[2][2] = WHITE
-    board[2][3] = BLACK
-    board[3][2] = BLACK
-    board[3][3] = WHITE
-    return board
+    return OseroBoard.initial()
 
 def is_on_board(x, y):
     return 0 <= x < SIZE and 0 <= y < SIZE
 
 def valid_moves(board, color):
-    other = BLACK if color == WHITE else WHITE
-    moves = set()
-    for y in range(SIZE):
-        for x in range(SIZE):
-            if board[y][x] != EMPTY:
-                continue
-            for dx, dy in DIRECTIONS:
-                nx, ny = x + dx, y + dy
-                found_other = False
-                while is_on_board(nx, ny) and board[ny][nx] == other:
-                    nx += dx
-                    ny += dy
-                    found_other = True
-                if found_other and is_on_board(nx, ny) and board[ny][nx] == color:
-                    moves.add((x, y))
-                    break
-    return moves
+    return {index_to_xy(i) for i in iter_bits(board.legal_mask(color))}
 
 def make_move(board, x, y, color):
-    other = BLACK if color == WHITE else WHITE
-    flipped = []
-    for dx, dy in DIRECTIONS:
-        nx, ny = x + dx, y + dy
-        path = []
-        while is_on_board(nx, ny) and board[ny][nx] == other:
-            path.append((nx, ny))
-            nx += dx
-            ny += dy
-        if path and is_on_board(nx, ny) and board[ny][nx] == color:
-            flipped.extend(path)
-    if flipped:
-        board[y][x] = color
-        for fx, fy in flipped:
-            board[fy][fx] = color
-        return True
-    elif board[y][x] == (WHITE if color == BLACK else BLACK):
-        board[y][x] = color
-        return True
-    return False
+    """石を置き、色が変わったマスの座標リストを返す（置けなければ空リスト）"""
+    return [index_to_xy(i) for i in iter_bits(board.play(x, y, color))]
+
+async def board_to_file(board, renderer=None):
+    key = board_key(board)
+    data = render_cache.get(key)
+    if data is None:
+        # 画像生成はワーカーで行い、イベントループを止めない
+        if render_pool.uses_processes:
+            renderer = None  # 差分描画用の画像はプロセスをまたげない
+        data = await render_pool.run(render_board, board.copy(), renderer)
+        render_cache.put(key, data)
+    # 一時ファイルを使わず、メモリ上のバイト列をそのまま添付する
+    return discord.File(BytesIO(data), filename=IMAGE_FILENAME)
+
+def overrides_left(game, player_id):
+    """player_id の残り上書き回数"""
+    if player_id == bot.user.id:
+        return OVERRIDE_LIMIT - game.get("bot_override_count", 0)
+    counts = game.get("override_count") or {}
+    return OVERRIDE_LIMIT - counts.get(player_id, 0)
+
+# 進行中の対局のスナップショット（再起動後の再開用）
+#   先手・後手の ID、黒・白の石、上書きされた座標、手番、強さ、上書き回数（先手・後手・Bot）、直前の手
+STATE_KIND = "osero"
+SNAPSHOT = struct.Struct("<QQQQQBBBBBB")
+NO_POSITION = 255
+
+def pack_game(game):
+    p0, p1 = game["players"]
+    counts = game.get("override_count") or {}
+    placed = 0
+    for x, y in game.get("placed_positions", ()):
+        placed |= 1 << bit_index(x, y)
+    last_pos = game["last_pos"]
+    return SNAPSHOT.pack(
+        p0, p1, game["board"].black, game["board"].white, placed,
+        game["turn"], list(LEVELS).index(game.get("level", DEFAULT_LEVEL)),
+        counts.get(p0, 0), counts.get(p1, 0), game.get("bot_override_count", 0),
+        NO_POSITION if last_pos is None else bit_index(*last_pos),
+    )
+
+def unpack_game(data):
+    (p0, p1, black, white, placed, turn, level,
+     count0, count1, bot_count, last_pos) = SNAPSHOT.unpack(data)
+    return {
+        "stage": "playing",
+        "level": list(LEVELS)[level],
+        "players": [p0, p1],
+        "board": OseroBoard(black, white),
+        "renderer": BoardRenderer(),
+        "turn": turn,
+        "last_pos": None if last_pos == NO_POSITION else index_to_xy(last_pos),
+        "override_count": {p0: count0, p1: count1},
+        "bot_override_count": bot_count,
+        "placed_positions": {index_to_xy(i) for i in iter_bits(placed)},
+    }
+
+def save_game(channel_id):
+    """対局中の盤面を保存する（書き込みはまとめて別スレッドで行われる）"""
+    game = games.get(channel_id)
+    if game and game.get("stage") == "playing":
+        get_store().put(STATE_KIND, channel_id, pack_game(game))
+        sessions.touch(STATE_KIND, channel_id, IDLE_TIMEOUT, expire_game)
+
+def drop_game(channel_id):
+    game = games.pop(channel_id, None)
+    # じゃんけん中のボタンが後から押されても、ゲームを作り直さないようにする
+    if game and game.get("janken_view"):
+        game["janken_view"].stop()
+    router.discard(channel_id, STATE_KIND)
+    get_store().delete(STATE_KIND, channel_id)
+    sessions.remove(STATE_KIND, channel_id)
+
+async def expire_game(channel_id):
+    """しばらく操作のなかったゲームを片付ける"""
+    bot_turns.cancel(channel_id)
+    drop_game(channel_id)
+    channel = bot.get_channel(channel_id)
+    if channel:
+        await channel.send("一定時間操作がなかったため、ゲームを終了しました。")
+
+async def restore_game(channel_id, data, channel):
+    """保存されていた対局を読み戻し、チャンネルに再開を知らせる"""
+    game = games[channel_id] = unpack_game(data)
+    router.add(channel_id, STATE_KIND, handle_message)
+    save_game(channel_id)
+    next_player = game["players"][game["turn"]]
+    await channel.send("Bot が再起動したため、対局を再開します。")
+    await channel.send(file=await board_to_file(game["board"], game["renderer"]))
+    if next_player == bot.user.id:
+        bot_turns.request(channel_id)
+    else:
+        await channel.send(f"<@{next_player}> の番です。例：'D3' のように送信してください。")
 
-def generate_osero_image(board, background_path, black_path, white_path, output_path):
-    background = Image.open(background_path).convert("RGBA")
-    black = Image.open(black_path).convert("RGBA")
-    white = Image.open(white_path).convert("RGBA")
-
-    width, height = background.size
-    cell_width = width // (SIZE + 2)  # サイズに応じてセル幅を計算
-    cell_height = height // (SIZE + 2)
-
-    scale_ratio = 1.0
-    piece_width = int(cell_width * scale_ratio)
-    piece_height = int(cell_height * scale_ratio)
-    offset_x = (cell_width - piece_width) // 2
-    offset_y = (cell_height - piece_height) // 2
-
-    def place_piece_scaled(base_img, piece_img, col, row):
-        x = col * cell_width + offset_x
-        y = row * cell_height + offset_y
-        resized = piece_img.resize((piece_width, piece_height))
-        base_img.paste(resized, (x, y), resized)
-
-    base = background.copy()
-    for y in range(SIZE):  # ループ範囲を SIZE に変更
-        for x in range(SIZE):
-            cell = board[y][x]
-            if cell == BLACK:
-                place_piece_scaled(base, black, col=x+1, row=y+1)
-            elif cell == WHITE:
-                place_piece_scaled(base, white, col=x+1, row=y+1)
-
-    base.save(output_path)
-    return output_path
-
-def board_to_file(board):
-    path = "osero_output.png"
-    generate_osero_image(board, GFX_BACKGROUND, GFX_BLACK, GFX_WHITE, path)
-    return path
-
-def count_flippable(board, x, y, color):
-    temp = [row[:] for row in board]
-    before = sum(row.count(color) for row in temp)
-    if not make_move(temp, x, y, color):
-        return -1
-    after = sum(row.count(color) for row in temp)
-    return after - before
-
-async def simulate_bot_turn(channel_id):
-    async def simulate_bot_turn(channel_id):
-       game = games.get(channel_id)
-       if not game or game["stage"] != "playing":
-           return
-
-       await asyncio.sleep(2)
-
-       channel = bot.get_channel(channel_id)
-       board = game["board"]
-       color = BLACK if game["turn"] == 0 else WHITE
-       opponent_color = WHITE if color == BLACK else BLACK
-       legal_moves = list(valid_moves(board, color))
-
-       # Botの上書き回数を初期化
-       if "bot_override_count" not in game:
-           game["bot_override_count"] = 0
-
-       # 上書き可能な場合、上書きを試みる
-       if game["bot_override_count"] < 10:
-           override_candidates = [(x, y) for y in range(SIZE) for x in range(SIZE) if board[y][x] == opponent_color]
-           best_pos = None
-           max_flips = -1
-           for x, y in override_candidates:
-               flips = count_flippable(board, x, y, color)
-               if flips > max_flips:
-                   best_pos = (x, y)
-                   max_flips = flips
-
-           if best_pos and max_flips > 0:
-               col, row = best_pos
-               board[row][col] = color
-               game["last_pos"] = (col, row)
-               game["turn"] = 1 - game["turn"]
-               game["bot_override_count"] += 1  # 上書き回数をインクリメント
-
-               col_label = chr(ord("A") + col)
-               row_label = str(row + 1)
-               await channel.send(f"Bot は {col_label}{row_label} に上書きしました！ (残り上書き回数: {10 - game['bot_override_count']})")
-
-               path = board_to_file(board)
-               await channel.send(file=discord.File(path))
-
-               next_player = game["players"][game["turn"]]
-               if next_player == bot.user.id:
-                   await simulate_bot_turn(channel_id)
-               else:
-                   await channel.send(f"<@{next_player}> の番です。例：'D3' のように送信してください。")
-               return
-
-       # 上書きできない場合、通常の合法手を選択
-       if legal_moves:
-           col, row = random.choice(legal_moves)
-           make_move(board, col, row, color)
-           game["last_pos"] = (col, row)
-           game["turn"] = 1 - game["turn"]
-
-           col_label = chr(ord("A") + col)
-           row_label = str(row + 1)
-           await channel.send(f"Bot は {col_label}{row_label} に置きました。")
-
-           path = board_to_file(board)
-           await channel.send(file=discord.File(path))
-
-       # 次のプレイヤーへ
-       next_color = BLACK if game["turn"] == 0 else WHITE
-       next_player = game["players"][game["turn"]]
-       valid = valid_moves(board, next_color)
-
-       if not valid:
-           other_color = WHITE if next_color == BLACK else BLACK
-           if not valid_moves(board, other_color):
-               blacks = sum(row.count(BLACK) for row in board)
-               whites = sum(row.count(WHITE) for row in board)
-               result = f"黒({BLACK}): {blacks} 石\n白({WHITE}): {whites} 石\n"
-               if blacks > whites:
-                   result += f"<@{game['players'][0]}> の勝ち！"
-               elif whites > blacks:
-                   result += f"<@{game['players'][1]}> の勝ち！"
-               else:
-                   result += "引き分け！"
-               await channel.send(result)
-               del games[channel_id]
-               return
-           else:
-               await channel.send(f"<@{next_player}> に合法手がないため、スキップされます。")
-               game["turn"] = 1 - game["turn"]
-               next_player = game["players"][game["turn"]]
-
-       if next_player == bot.user.id:
-           await simulate_bot_turn(channel_id)
-       else:
-           await channel.send(f"<@{next_player}> の番です。例：'D3' のように送信してください。")
+async def play_bot_turn(channel_id):
+    """
+    Bot の手を 1 手だけ打って手番を進める。
+    続けて Bot の手番になる場合は True を返す（呼び出し側がループで回す）。
+    """
     game = games.get(channel_id)
     if not game or game["stage"] != "playing":
-        return
+        return False
+    if game["players"][game["turn"]] != bot.user.id:
+        return False
 
     await asyncio.sleep(2)
+    if games.get(channel_id) is not game:
+        return False
 
     channel = bot.get_channel(channel_id)
     board = game["board"]
     color = BLACK if game["turn"] == 0 else WHITE
     opponent_color = WHITE if color == BLACK else BLACK
-    legal_moves = list(valid_moves(board, color))
+    opponent_id = game["players"][1 - game["turn"]]
 
     # Botの上書き回数を初期化
     if "bot_override_count" not in game:
         game["bot_override_count"] = 0
 
-    # 上書き可能な場合、上書きを試みる
-    if game["bot_override_count"] < 10:
-        override_candidates = [(x, y) for y in range(SIZE) for x in range(SIZE) if board[y][x] == opponent_color]
-        best_pos = None
-        max_flips = -1
-        for x, y in override_candidates:
-            flips = count_flippable(board, x, y, color)
-            if flips > max_flips:
-                best_pos = (x, y)
-                max_flips = flips
-
-        if best_pos and max_flips > 0:
-            col, row = best_pos
-            board[row][col] = color
-            game["last_pos"] = (col, row)
-            game["turn"] = 1 - game["turn"]
-            game["bot_override_count"] += 1  # 上書き回数をインクリメント
-
-            col_label = chr(ord("A") + col)
-            row_label = str(row + 1)
-            await channel.send(f"Bot は {col_label}{row_label} に上書きしました！ (残り上書き回数: {10 - game['bot_override_count']})")
-
-            path = board_to_file(board)
-            await channel.send(file=discord.File(path))
-
-            next_player = game["players"][game["turn"]]
-            if next_player == bot.user.id:
-                await simulate_bot_turn(channel_id)
-            else:
-                await channel.send(f"<@{next_player}> の番です。例：'D3' のように送信してください。")
-            return
-
-    # 上書きできない場合、通常の合法手を選択
-    if legal_moves:
-        col, row = random.choice(legal_moves)
+    # 思考はワーカーで行い、イベントループを止めない
+    level = LEVELS[game.get("level", DEFAULT_LEVEL)]
+    own, opp = board.bits(color)
+    move = await search_pool.run(
+        choose_move, own, opp,
+        overrides_left(game, bot.user.id), overrides_left(game, opponent_id),
+        level.max_depth, level.time_ms, level.use_book,
+    )
+
+    if move is not None:
+        col, row = index_to_xy(move)
+        overriding = board.get(col, row) == opponent_color
         make_move(board, col, row, color)
         game["last_pos"] = (col, row)
         game["turn"] = 1 - game["turn"]
 
         col_label = chr(ord("A") + col)
         row_label = str(row + 1)
-        await channel.send(f"Bot は {col_label}{row_label} に置きました。")
+        if overriding:
+            game["bot_override_count"] += 1  # 上書き回数をインクリメント
+            await channel.send(f"Bot は {col_label}{row_label} に上書きしました！ (残り上書き回数: {overrides_left(game, bot.user.id)})")
+        else:
+            await channel.send(f"Bot は {col_label}{row_label} に置きました。")
 
-        path = board_to_file(board)
-        await channel.send(file=discord.File(path))
+        await channel.send(file=await board_to_file(board, game["renderer"]))
 
     # 次のプレイヤーへ
     next_color = BLACK if game["turn"] == 0 else WHITE
@@ -292,8 +198,8 @@ async def simulate_bot_turn(channel_id):
     if not valid:
         other_color = WHITE if next_color == BLACK else BLACK
         if not valid_moves(board, other_color):
-            blacks = sum(row.count(BLACK) for row in board)
-            whites = sum(row.count(WHITE) for row in board)
+            blacks = board.count(BLACK)
+            whites = board.count(WHITE)
             result = f"黒({BLACK}): {blacks} 石\n白({WHITE}): {whites} 石\n"
             if blacks > whites:
                 result += f"<@{game['players'][0]}> の勝ち！"
@@ -302,59 +208,59 @@ async def simulate_bot_turn(channel_id):
             else:
                 result += "引き分け！"
             await channel.send(result)
-            del games[channel_id]
-            return
+            drop_game(channel_id)
+            return False
         else:
             await channel.send(f"<@{next_player}> に合法手がないため、スキップされます。")
             game["turn"] = 1 - game["turn"]
             next_player = game["players"][game["turn"]]
 
-    if next_player == bot.user.id:
-        await simulate_bot_turn(channel_id)
-    else:
-        await channel.send(f"<@{next_player}> の番です。例：'D3' のように送信してください。")
-    return
-
-    col, row = random.choice(legal_moves)
-    make_move(board, col, row, color)
-    game["last_pos"] = (col, row)
-    game["turn"] = 1 - game["turn"]
-
-    col_label = chr(ord("A") + col)
-    row_label = str(row + 1)
-    await channel.send(f"Bot は {col_label}{row_label} に置きました。")
+    save_game(channel_id)
 
-    path = board_to_file(board)
-    await channel.send(file=discord.File(path))
-
-    next_color = BLACK if game["turn"] == 0 else WHITE
-    next_player = game["players"][game["turn"]]
-    valid = valid_moves(board, next_color)
+    if next_player == bot.user.id:
+        return True
+    await channel.send(f"<@{next_player}> の番です。例：'D3' のように送信してください。")
+    return False
 
-    if not valid:
-        other_color = WHITE if next_color == BLACK else BLACK
-        if not valid_moves(board, other_color):
-            blacks = sum(row.count(BLACK) for row in board)
-            whites = sum(row.count(WHITE) for row in board)
-            result = f"黒({BLACK}): {blacks} 石\n白({WHITE}): {whites} 石\n"
-            if blacks > whites:
-                result += f"<@{game['players'][0]}> の勝ち！"
-            elif whites > blacks:
-                result += f"<@{game['players'][1]}> の勝ち！"
-            else:
-                result += "引き分け！"
-            await channel.send(result)
-            del games[channel_id]
-            return
-        else:
-            await channel.send(f"<@{next_player}> に合法手がないため、スキップされます。")
-            game["turn"] = 1 - game["turn"]
-            next_player = game["players"][game["turn"]]
 
-    if next_player == bot.user.id:
-        await simulate_bot_turn(channel_id)
-    else:
-        await channel.send(f"<@{next_player}> の番です。例：'D3' のように送信してください。")
+class BotTurnScheduler:
+    """
+    チャンネルごとに 1 つのタスクと待ち行列で Bot の手番を処理する。
+    Bot 同士の対戦やパスが続いても、再帰せずループで 1 手ずつ進める。
+    """
+
+    def __init__(self):
+        self.queues = {}
+        self.tasks = {}
+
+    def request(self, channel_id):
+        """Bot の手番を予約する（すぐに戻る）"""
+        queue = self.queues.get(channel_id)
+        if queue is None:
+            queue = self.queues[channel_id] = asyncio.Queue()
+            self.tasks[channel_id] = asyncio.create_task(self._run(channel_id, queue))
+        queue.put_nowait(channel_id)
+
+    def cancel(self, channel_id):
+        self.queues.pop(channel_id, None)
+        task = self.tasks.pop(channel_id, None)
+        if task:
+            task.cancel()
+
+    async def _run(self, channel_id, queue):
+        try:
+            while not queue.empty():
+                queue.get_nowait()
+                while await play_bot_turn(channel_id):
+                    pass
+        finally:
+            # 待ち行列が空になったらタスクを片付ける（cancel 済みなら何もしない）
+            if self.tasks.get(channel_id) is asyncio.current_task():
+                del self.tasks[channel_id]
+                del self.queues[channel_id]
+
+
+bot_turns = BotTurnScheduler()
 
 from discord.ui import View, Button
 
@@ -387,6 +293,11 @@ class JankenView(View):
             await self.resolve(interaction.channel)
 
     async def resolve(self, channel):
+        # 終了・期限切れの後や、決着済みのボタンが押されたときは何もしない
+        game = games.get(channel.id)
+        if not game or game.get("stage") != "janken" or game.get("janken_view") is not self:
+            return
+        self.stop()
         p1_choice = self.choices[self.p1]
         p2_choice = self.choices[self.p2]
 
@@ -400,32 +311,33 @@ class JankenView(View):
         }
 
         if p1_choice == p2_choice:
-            await channel.send("引き分けです。もう一度！", view=JankenView(self.p1, self.p2))
+            view = game["janken_view"] = JankenView(self.p1, self.p2)
+            await channel.send("引き分けです。もう一度！", view=view)
         else:
             winner = result_map[(p1_choice, p2_choice)]
             loser = self.p1 if winner == self.p2 else self.p2
 
-            # ゲーム開始
-            games[channel.id] = {
+            # ゲーム開始（ルーターへの登録は !osero のときに済んでいる）
+            game.pop("janken_view")
+            game.update({
                 "players": [winner, loser],
                 "board": create_board(),
+                "renderer": BoardRenderer(),
                 "stage": "playing",
                 "turn": 0,
                 "last_pos": None
-            }
+            })
+            save_game(channel.id)
             await channel.send(f"<@{winner}> が先攻（{BLACK}）です！")
-            path = board_to_file(games[channel.id]["board"])
-            await channel.send(file=discord.File(path))
+            await channel.send(file=await board_to_file(game["board"], game["renderer"]))
             await channel.send(f"<@{winner}> の番です。例：'D3' のように送信してください。")
 
 @bot.event
 async def on_message(message):
-    # コマンドが優先されるように
-    await bot.process_commands(message)
-    # Bot自身のメッセージは無視
-    if message.author.bot:
-        return
+    await route_message(bot, message)
 
+async def handle_message(message):
+    # ゲームのあるチャンネルの、コマンドでない人間のメッセージだけが届く
     cid = message.channel.id
     # ゲームが開始されていないチャンネルは無視
     if cid not in games:
@@ -452,27 +364,29 @@ async def on_message(message):
             random.shuffle(players)
             game["players"] = players
             game["board"]   = create_board()
+            game["renderer"]= BoardRenderer()
             game["stage"]   = "playing"
             game["turn"]    = 0
             game["last_pos"]= None
             # 上書き回数初期化
-            game["override_count"] = 0
+            game["override_count"] = {p: 0 for p in players}
+            save_game(cid)
 
             await message.channel.send(f"<@{players[0]}> が先攻（{BLACK}）です！")
-            path = board_to_file(game["board"])
-            await message.channel.send(file=discord.File(path))
+            await message.channel.send(file=await board_to_file(game["board"], game["renderer"]))
             await message.channel.send(f"<@{players[0]}> の番です。例：'D3' のように送信してください。")
 
             # Botが先攻なら即打ち
             if players[0] == bot.user.id:
-                await simulate_bot_turn(cid)
+                bot_turns.request(cid)
             return
 
         # 人間同士ならじゃんけんフェーズへ
         else:
+            view = game["janken_view"] = JankenView(message.author.id, opponent.id)
             await message.channel.send(
                 f"<@{message.author.id}> vs <@{opponent.id}> でじゃんけんを始めます。ボタンで選んでください！",
-                view=JankenView(message.author.id, opponent.id)
+                view=view
             )
             game["stage"] = "janken"
             return
@@ -490,12 +404,12 @@ async def on_message(message):
         return
 
     # === 手入力から座標を取得 ===
-    move = message.content.upper().strip()
-    if len(move) < 2 or move[0] not in "ABCDEFGH" or not move[1:].isdigit():
+    move = MOVE_PATTERN.fullmatch(message.content)
+    if move is None:
         return
 
-    col = ord(move[0]) - ord("A")
-    row = int(move[1:]) - 1
+    col = ord(move.group(1).upper()) - ord("A")
+    row = int(move.group(2)) - 1
     if not is_on_board(col, row):
         return
 
@@ -504,14 +418,14 @@ async def on_message(message):
     opponent_color = WHITE if color == BLACK else BLACK
 
    # ── 人間プレイヤーの上書き回数制限 ──
-    if board[row][col] == opponent_color:
+    if board.get(col, row) == opponent_color:
         if "override_count" not in game:
             game["override_count"] = {game["players"][0]: 0, game["players"][1]: 0}
 
         # プレイヤーの上書き回数を確認
         current_player = game["players"][game["turn"]]
-        if game["override_count"][current_player] >= 10:
-            await message.channel.send("上書きは10回まで可能です。")
+        if overrides_left(game, current_player) <= 0:
+            await message.channel.send(f"上書きは{OVERRIDE_LIMIT}回まで可能です。")
             return
 
         # ── 相手が置いた座標に連続で上書きしないようにチェック ──
@@ -523,11 +437,11 @@ async def on_message(message):
         game["override_count"][current_player] += 1
 
         # 残り回数を自動送信
-        rem = 10 - game["override_count"][current_player]
+        rem = overrides_left(game, current_player)
         await message.channel.send(f"上書きはあと{rem}回可能です。／You can override {rem} more times.")
 
     # 自分の石への上書きは禁止
-    if board[row][col] == color:
+    if board.get(col, row) == color:
         await message.channel.send("自分の石がある場所には置けません。")
         return
 
@@ -544,8 +458,7 @@ async def on_message(message):
     game["turn"]     = 1 - game["turn"]
 
     # 盤面画像を送信
-    path = board_to_file(board)
-    await message.channel.send(file=discord.File(path))
+    await message.channel.send(file=await board_to_file(board, game["renderer"]))
 
     # 次のプレイヤーへ
     next_color  = BLACK if game["turn"] == 0 else WHITE
@@ -556,14 +469,14 @@ async def on_message(message):
     if not valid:
         other_color = WHITE if next_color == BLACK else BLACK
         if not valid_moves(board, other_color):
-            blacks = sum(r.count(BLACK) for r in board)
-            whites = sum(r.count(WHITE) for r in board)
+            blacks = board.count(BLACK)
+            whites = board.count(WHITE)
             result = f"黒({BLACK}): {blacks} 石\n白({WHITE}): {whites} 石\n"
             if   blacks > whites:  result += f"<@{game['players'][0]}> の勝ち！"
             elif whites > blacks:  result += f"<@{game['players'][1]}> の勝ち！"
             else:                  result += "引き分け！"
             await message.channel.send(result)
-            del games[cid]
+            drop_game(cid)
             return
         # 自分は打てないが相手は打てる→スキップ
         else:
@@ -573,32 +486,54 @@ async def on_message(message):
             game["turn"] = 1 - game["turn"]
             next_player  = game["players"][game["turn"]]
 
+    save_game(cid)
+
     # 次がBotならBotに移譲、そうでなければメンション
     if next_player == bot.user.id:
-        await simulate_bot_turn(cid)
+        bot_turns.request(cid)
     else:
         await message.channel.send(
             f"<@{next_player}> の番です。例：'D3' のように送信してください。"
         )
 
 @bot.command()
-async def osero(ctx):
+async def osero(ctx, level: str = DEFAULT_LEVEL):
+    """!osero [easy|normal|hard] で Bot の強さも指定できる"""
+    if level not in LEVELS:
+        await ctx.send(f"強さは {' / '.join(LEVELS)} から選んでください。")
+        return
     games[ctx.channel.id] = {
-        "stage": "await_opponent"
+        "stage": "await_opponent",
+        "level": level,
     }
+    router.add(ctx.channel.id, STATE_KIND, handle_message)
+    # 相手が決まらないまま放置されたら片付ける
+    sessions.touch(STATE_KIND, ctx.channel.id, LOBBY_TIMEOUT, expire_game)
     await ctx.send("対戦相手を `@ユーザー名` で指定してください（または @Bot と対戦）。")
 
+async def end_game(ctx):
+    """チャンネルのゲームを強制終了する（終了したら True）"""
+    if ctx.channel.id not in games:
+        return False
+    bot_turns.cancel(ctx.channel.id)
+    drop_game(ctx.channel.id)
+    await ctx.send("ゲームを強制終了しました。")
+    return True
+
 @bot.command()
 async def end(ctx):
-    if ctx.channel.id in games:
-        del games[ctx.channel.id]
-        await ctx.send("ゲームを強制終了しました。")
-    else:
+    if not await end_game(ctx):
         await ctx.send("進行中のゲームはありません。")
 
 @bot.event
 async def on_ready():
     print(f"{bot.user} としてログインしました")
+    await restore_once()
+
+saved_games = SavedGames(STATE_KIND, games, restore_game, channel_of=key_channel_id)
+
+async def restore_once():
+    await saved_games.restore_once(bot)
 
 @bot.command()
 async def c(ctx):
@@ -609,9 +544,20 @@ async def c(ctx):
         await ctx.send("進行中のゲームがありません")
         return
 
-    # 現在の上書き使用回数を取得（未定義なら0）
-    used = game.get("override_count", 0)
-    remaining = max(0, 10 - used)
+    # 実行した人の残り回数を取得（未使用なら上限そのまま）
+    remaining = max(0, overrides_left(game, ctx.author.id))
     await ctx.send(f"上書きはあと{remaining}回可能です！")
 
-bot.run(TOKEN)
\ No newline at end of file
+def warm_up():
+    """盤面画像のスプライトと定石ブックを先に読み込んでおく（最初の 1 局目が遅れないように）"""
+    get_sprites()
+    get_book()
+
+async def setup(host):
+    global bot
+    host.adopt(bot, listeners=[(restore_once, "on_ready")], end_game=end_game)
+    bot = host
+
+if __name__ == "__main__":
+    warm_up()
+    bot.run(TOKEN)
\ No newline at end of file
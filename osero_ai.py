@@ -0,0 +1,336 @@
+"""オセロ Bot の思考エンジン
+
+序盤は定石ブック、終盤は完全読み、それ以外は
+negamax + αβ 枝刈り、反復深化、置換表、手の並べ替えで探索する。
+ハウスルールの「相手の石への上書き」も、残り回数がある間は候補手に含める。
+定石ブックと完全読みは上書きのない通常ルールで作っている。
+ワーカープロセス上で呼ばれる前提なので、引数と戻り値は整数だけにしている。
+"""
+
+import os
+import time
+from collections import namedtuple
+from pathlib import Path
+
+from book_file import BookFile, LazyBook
+from osero_board import (
+    CELLS, SIZE, FULL_MASK, flip_mask, index_to_xy, iter_bits, legal_mask, popcount,
+)
+
+Level = namedtuple("Level", ["max_depth", "time_ms", "use_book"])
+
+# 強さの設定（最大探索深さ, 1 手あたりの思考時間, 定石ブックと終盤の完全読みを使うか）
+LEVELS = {
+    "easy": Level(1, 50, False),
+    "normal": Level(6, 200, True),
+    "hard": Level(CELLS, 1000, True),
+}
+DEFAULT_LEVEL = "normal"
+
+# 6x6 盤のマスの重み（角が最も強く、角の隣は危険）
+WEIGHTS = [
+    100, -20, 10, 10, -20, 100,
+    -20, -50, -2, -2, -50, -20,
+     10,  -2,  1,  1,  -2,  10,
+     10,  -2,  1,  1,  -2,  10,
+    -20, -50, -2, -2, -50, -20,
+    100, -20, 10, 10, -20, 100,
+]
+assert len(WEIGHTS) == SIZE * SIZE
+
+MOBILITY_WEIGHT = 5
+OVERRIDE_WEIGHT = 8
+WIN_SCORE = 10000
+INF = WIN_SCORE * 10
+
+EXACT, LOWER, UPPER = 0, 1, 2
+TT_LIMIT = 200000
+
+# ワーカーごとに持ち続ける置換表: key -> (深さ, 評価値, 種別, 最善手)
+_table = {}
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def apply_move(own, opp, index):
+    """index に置いた（または上書きした）後の (自分, 相手) を返す"""
+    bit = 1 << index
+    changed = flip_mask(own, opp, bit) | (bit & ~own)
+    return own | changed, opp & ~changed
+
+
+def positional(bits):
+    return sum(WEIGHTS[i] for i in iter_bits(bits))
+
+
+def evaluate(own, opp, mine, theirs):
+    score = positional(own) - positional(opp)
+    score += MOBILITY_WEIGHT * (popcount(legal_mask(own, opp)) - popcount(legal_mask(opp, own)))
+    score += OVERRIDE_WEIGHT * (mine - theirs)
+    return score
+
+
+def final_score(own, opp):
+    diff = popcount(own) - popcount(opp)
+    if diff > 0:
+        return WIN_SCORE + diff
+    if diff < 0:
+        return -WIN_SCORE + diff
+    return 0
+
+
+class Searcher:
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.nodes = 0
+
+    def ordered_moves(self, own, opp, legal, mine, hint):
+        candidates = legal | (opp if mine > 0 else 0)
+        moves = sorted(iter_bits(candidates), key=lambda i: (WEIGHTS[i], not opp >> i & 1), reverse=True)
+        if hint is not None and hint in moves:
+            moves.remove(hint)
+            moves.insert(0, hint)
+        return moves
+
+    def negamax(self, own, opp, mine, theirs, depth, alpha, beta):
+        self.nodes += 1
+        if self.nodes & 255 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        legal = legal_mask(own, opp)
+        if not legal:
+            # 合法手がなければパス。両者とも打てなければ終局
+            if not legal_mask(opp, own):
+                return final_score(own, opp)
+            return -self.negamax(opp, own, theirs, mine, depth, -beta, -alpha)
+        if depth == 0:
+            return evaluate(own, opp, mine, theirs)
+
+        key = (own, opp, mine, theirs)
+        entry = _table.get(key)
+        hint = None
+        if entry is not None:
+            entry_depth, value, flag, hint = entry
+            if entry_depth >= depth:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                elif flag == UPPER:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+
+        alpha_orig = alpha
+        best = -INF
+        best_move = None
+        for index in self.ordered_moves(own, opp, legal, mine, hint):
+            used = opp >> index & 1
+            next_own, next_opp = apply_move(own, opp, index)
+            value = -self.negamax(next_opp, next_own, theirs, mine - used, depth - 1, -beta, -alpha)
+            if value > best:
+                best = value
+                best_move = index
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+        if best <= alpha_orig:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        if len(_table) >= TT_LIMIT:
+            _table.clear()
+        _table[key] = (depth, best, flag, best_move)
+        return best
+
+    def root(self, own, opp, mine, theirs, depth, hint):
+        legal = legal_mask(own, opp)
+        alpha = -INF
+        best_move = None
+        for index in self.ordered_moves(own, opp, legal, mine, hint):
+            used = opp >> index & 1
+            next_own, next_opp = apply_move(own, opp, index)
+            value = -self.negamax(next_opp, next_own, theirs, mine - used, depth - 1, -INF, -alpha)
+            if value > alpha or best_move is None:
+                alpha = value
+                best_move = index
+        return best_move, alpha
+
+
+# ── 終盤の完全読み ──────────────────────────────
+
+# 空きマスがこの数以下になったら最後まで読み切る
+ENDGAME_EMPTIES = int(os.getenv("OSERO_ENDGAME_EMPTIES", "10"))
+
+
+class EndgameSolver:
+    def __init__(self, deadline=None):
+        self.deadline = deadline
+        self.nodes = 0
+
+    def solve(self, own, opp, alpha, beta, passed):
+        self.nodes += 1
+        if self.deadline is not None and self.nodes & 255 == 0 and time.perf_counter() > self.deadline:
+            raise SearchTimeout
+
+        legal = legal_mask(own, opp)
+        if not legal:
+            if passed:
+                return popcount(own) - popcount(opp)
+            return -self.solve(opp, own, -beta, -alpha, True)
+
+        children = [apply_move(own, opp, index) for index in iter_bits(legal)]
+        if len(children) > 1:
+            # 相手の打てる手が少なくなる手から読む（速さ優先探索）
+            children.sort(key=lambda child: popcount(legal_mask(child[1], child[0])))
+        best = -CELLS
+        for next_own, next_opp in children:
+            value = -self.solve(next_opp, next_own, -beta, -alpha, False)
+            if value > best:
+                best = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        return best
+
+
+def solve_endgame(own, opp, deadline=None):
+    """
+    上書きなしの通常ルールで終局まで読み切り、(最善手, 最終石差) を返す。
+    打てる手がなければ (None, 石差)。
+    deadline（time.perf_counter() の値）を過ぎたら SearchTimeout を送出する。
+    """
+    solver = EndgameSolver(deadline)
+    legal = legal_mask(own, opp)
+    if not legal:
+        return None, solver.solve(own, opp, -CELLS, CELLS, False)
+    best_move = None
+    alpha = -CELLS - 1
+    for index in iter_bits(legal):
+        next_own, next_opp = apply_move(own, opp, index)
+        value = -solver.solve(next_opp, next_own, -CELLS, -alpha, False)
+        if value > alpha:
+            alpha = value
+            best_move = index
+    return best_move, alpha
+
+
+# ── 定石ブック ──────────────────────────────────
+
+# 盤面の 8 通りの対称変換（マス番号の置換表）
+def _symmetries():
+    tables = []
+    for transpose in (False, True):
+        for flip_x in (False, True):
+            for flip_y in (False, True):
+                table = []
+                for index in range(CELLS):
+                    x, y = index_to_xy(index)
+                    if transpose:
+                        x, y = y, x
+                    if flip_x:
+                        x = SIZE - 1 - x
+                    if flip_y:
+                        y = SIZE - 1 - y
+                    table.append(y * SIZE + x)
+                tables.append(table)
+    return tables
+
+
+SYMMETRIES = _symmetries()
+
+
+def transform(bits, table):
+    result = 0
+    for index in iter_bits(bits):
+        result |= 1 << table[index]
+    return result
+
+
+def canonical(own, opp):
+    """対称な盤面を同一視した代表の (キー, 使った変換表) を返す"""
+    best = None
+    for table in SYMMETRIES:
+        key = (transform(own, table) << CELLS) | transform(opp, table)
+        if best is None or key < best[0]:
+            best = (key, table)
+    return best
+
+
+BOOK_MAGIC = b"OSBK1\n"
+BOOK_KEY_BYTES = (2 * CELLS + 7) // 8
+
+
+class OpeningBook(BookFile):
+    """build_osero_book.py が作るファイル。キーは手番側から見た正規化済みの盤面"""
+
+    def __init__(self, path):
+        super().__init__(path, BOOK_MAGIC, BOOK_KEY_BYTES)
+
+    def lookup(self, own, opp):
+        key, table = canonical(own, opp)
+        move = self.find(key)
+        # 正規化した盤面での手を元の向きに戻す
+        return None if move is None else table.index(move)
+
+
+BOOK_PATH = Path(os.getenv("OSERO_BOOK_PATH", Path(__file__).resolve().parent / "osero_book.bin"))
+_book = LazyBook(BOOK_PATH, OpeningBook)
+
+
+def get_book():
+    """定石ブックを（あれば）一度だけ開く"""
+    return _book.get()
+
+
+def choose_move(own, opp, mine=0, theirs=0, max_depth=6, time_ms=200, use_book=True):
+    """
+    手番側の石 own・相手の石 opp から次の一手のマス番号を返す（打てなければ None）。
+    mine / theirs はそれぞれの残り上書き回数。
+    time_ms を過ぎたら、最後に読み切った深さの最善手を返す。
+    use_book=False で定石ブックと終盤の完全読みを使わない。
+    完全読みには time_ms の半分までを使い、読み切れなければ残りの時間で通常の探索をする。
+    完全読みは上書きのない通常ルールなので、その結果をそのまま打つのはどちらの上書きも残っていないときだけ。
+    上書きが残っているときは、読み切った手を通常の探索で最初に読む手（打つ手の候補）として使う。
+    """
+    own &= FULL_MASK
+    opp &= FULL_MASK
+    if not legal_mask(own, opp):
+        return None
+
+    start = time.perf_counter()
+    best_move = None
+
+    if use_book:
+        book = get_book()
+        if book is not None:
+            move = book.lookup(own, opp)
+            if move is not None:
+                return move
+        # 終盤は読み切る
+        if CELLS - popcount(own | opp) <= ENDGAME_EMPTIES:
+            try:
+                best_move = solve_endgame(own, opp, start + time_ms / 2000)[0]
+            except SearchTimeout:
+                pass
+            else:
+                if mine == 0 and theirs == 0:
+                    return best_move
+
+    searcher = Searcher(start + time_ms / 1000)
+    empties = CELLS - popcount(own | opp)
+    for depth in range(1, max(1, min(max_depth, empties + 2 * (mine + theirs))) + 1):
+        try:
+            move, _ = searcher.root(own, opp, mine, theirs, depth, best_move)
+        except SearchTimeout:
+            break
+        best_move = move
+    if best_move is None:
+        best_move = searcher.ordered_moves(own, opp, legal_mask(own, opp), mine, None)[0]
+    return best_move
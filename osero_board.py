@@ -0,0 +1,171 @@
+"""オセロ盤面のビットボード実装
+
+黒石・白石をそれぞれ 1 つの整数で持ち、マス (x, y) はビット y * SIZE + x に対応する。
+合法手生成と反転計算はシフトとマスクだけで行う。
+"""
+
+EMPTY = "🟩"
+BLACK = "⚫"
+WHITE = "⚪"
+SIZE = 6
+
+CELLS = SIZE * SIZE
+FULL_MASK = (1 << CELLS) - 1
+
+# 左端列・右端列を除いたマスク（横方向シフトで行をまたがないように使う）
+_NOT_LEFT = FULL_MASK
+_NOT_RIGHT = FULL_MASK
+for _y in range(SIZE):
+    _NOT_LEFT &= ~(1 << (_y * SIZE))
+    _NOT_RIGHT &= ~(1 << (_y * SIZE + SIZE - 1))
+
+DIRECTIONS = [(-1, -1), (-1, 0), (-1, 1),
+              (0, -1),          (0, 1),
+              (1, -1),  (1, 0), (1, 1)]
+
+
+def _direction_mask(dx):
+    # 右へずらすと左端列に、左へずらすと右端列に回り込むので、その列を落とす
+    if dx == 1:
+        return _NOT_LEFT
+    if dx == -1:
+        return _NOT_RIGHT
+    return FULL_MASK
+
+
+# (シフト量, シフト後に掛けるマスク) の組
+SHIFTS = [(dy * SIZE + dx, _direction_mask(dx)) for dx, dy in DIRECTIONS]
+
+
+def shift(bits, amount, mask):
+    if amount > 0:
+        return (bits << amount) & mask
+    return (bits >> -amount) & mask
+
+
+def bit_index(x, y):
+    return y * SIZE + x
+
+
+def index_to_xy(index):
+    return index % SIZE, index // SIZE
+
+
+def iter_bits(bits):
+    """立っているビットの番号を小さい順に返す"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def legal_mask(own, opp):
+    """空きマスのうち、相手の石をはさめるマスのビット集合"""
+    empty = ~(own | opp) & FULL_MASK
+    moves = 0
+    for amount, mask in SHIFTS:
+        run = shift(own, amount, mask) & opp
+        # 間にはさまる相手の石は最大 SIZE - 2 個
+        for _ in range(SIZE - 3):
+            run |= shift(run, amount, mask) & opp
+        moves |= shift(run, amount, mask) & empty
+    return moves
+
+
+def flip_mask(own, opp, move_bit):
+    """move_bit に置いたとき裏返る相手の石のビット集合"""
+    flipped = 0
+    for amount, mask in SHIFTS:
+        run = 0
+        cursor = shift(move_bit, amount, mask)
+        while cursor & opp:
+            run |= cursor
+            cursor = shift(cursor, amount, mask)
+        if cursor & own:
+            flipped |= run
+    return flipped
+
+
+def popcount(bits):
+    return bits.bit_count()
+
+
+class OseroBoard:
+    __slots__ = ("black", "white")
+
+    def __init__(self, black=0, white=0):
+        self.black = black
+        self.white = white
+
+    @classmethod
+    def initial(cls):
+        board = cls()
+        board.set(2, 2, WHITE)
+        board.set(3, 2, BLACK)
+        board.set(2, 3, BLACK)
+        board.set(3, 3, WHITE)
+        return board
+
+    def copy(self):
+        return OseroBoard(self.black, self.white)
+
+    def key(self):
+        """盤面を一意に表す (黒, 白) の組"""
+        return self.black, self.white
+
+    def bits(self, color):
+        """(自分の石, 相手の石) の組を返す"""
+        if color == BLACK:
+            return self.black, self.white
+        return self.white, self.black
+
+    def get(self, x, y):
+        bit = 1 << bit_index(x, y)
+        if self.black & bit:
+            return BLACK
+        if self.white & bit:
+            return WHITE
+        return EMPTY
+
+    def set(self, x, y, color):
+        bit = 1 << bit_index(x, y)
+        self.black &= ~bit
+        self.white &= ~bit
+        if color == BLACK:
+            self.black |= bit
+        elif color == WHITE:
+            self.white |= bit
+
+    def count(self, color):
+        if color == BLACK:
+            return popcount(self.black)
+        if color == WHITE:
+            return popcount(self.white)
+        return CELLS - popcount(self.black | self.white)
+
+    def legal_mask(self, color):
+        own, opp = self.bits(color)
+        return legal_mask(own, opp)
+
+    def flip_mask(self, x, y, color):
+        own, opp = self.bits(color)
+        return flip_mask(own, opp, 1 << bit_index(x, y))
+
+    def play(self, x, y, color):
+        """
+        (x, y) に color を置き、変化したマスのビット集合を返す。置けなければ 0。
+        はさめない場合でも、相手の石があるマスなら上書きできる（ハウスルール）。
+        """
+        bit = 1 << bit_index(x, y)
+        own, opp = self.bits(color)
+        flipped = flip_mask(own, opp, bit)
+        if not flipped and not opp & bit:
+            return 0
+        changed = flipped | (bit & ~own)
+        own |= changed
+        opp &= ~changed
+        if color == BLACK:
+            self.black, self.white = own, opp
+        else:
+            self.white, self.black = own, opp
+        return changed
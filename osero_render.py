@@ -0,0 +1,178 @@
+"""オセロ盤面の画像生成
+
+スプライトは初回に一度だけ読み込んでセルサイズに縮小しておき（warm-up で先に読み込める）、
+同じ盤面のエンコード済み画像は LRU キャッシュから返す。
+ゲームごとの BoardRenderer は前回描いた画像を持ち続け、変化したマスだけを描き直す。
+ファイルには書き出さず、エンコード結果のバイト列をそのまま Discord に渡す。
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from pathlib import Path
+
+from osero_board import CELLS, SIZE, index_to_xy, iter_bits
+
+IMAGE_DIR = Path(__file__).resolve().parent / "image"
+
+GFX_BACKGROUND = IMAGE_DIR / "osero_bord.png"
+GFX_BLACK      = IMAGE_DIR / "osero_black.png"
+GFX_WHITE      = IMAGE_DIR / "osero_white.png"
+
+# 保持するエンコード済み盤面の数
+RENDER_CACHE_SIZE = int(os.getenv("OSERO_RENDER_CACHE_SIZE", "512"))
+
+# エンコード設定（CPU 負荷とアップロードサイズの調整用）
+#   OSERO_IMAGE_FORMAT       : png / webp
+#   OSERO_PNG_COMPRESS_LEVEL : 0（速い・大きい）〜 9（遅い・小さい）
+#   OSERO_WEBP_QUALITY       : 0 〜 100
+#   OSERO_WEBP_LOSSLESS      : 1 で可逆圧縮
+IMAGE_FORMAT = os.getenv("OSERO_IMAGE_FORMAT", "png").lower()
+PNG_COMPRESS_LEVEL = int(os.getenv("OSERO_PNG_COMPRESS_LEVEL", "6"))
+WEBP_QUALITY = int(os.getenv("OSERO_WEBP_QUALITY", "80"))
+WEBP_LOSSLESS = os.getenv("OSERO_WEBP_LOSSLESS", "0") == "1"
+
+if IMAGE_FORMAT not in ("png", "webp"):
+    raise ValueError(f"OSERO_IMAGE_FORMAT は png か webp を指定してください: {IMAGE_FORMAT}")
+
+IMAGE_FILENAME = f"osero.{IMAGE_FORMAT}"
+
+
+class Sprites:
+    def __init__(self, background_path, black_path, white_path):
+        # Pillow の読み込みは重いので、実際に描くときまで遅らせる
+        from PIL import Image
+
+        self.background = Image.open(background_path).convert("RGBA")
+
+        width, height = self.background.size
+        self.cell_width = width // (SIZE + 2)  # サイズに応じてセル幅を計算
+        self.cell_height = height // (SIZE + 2)
+
+        scale_ratio = 1.0
+        piece_width = int(self.cell_width * scale_ratio)
+        piece_height = int(self.cell_height * scale_ratio)
+        self.offset_x = (self.cell_width - piece_width) // 2
+        self.offset_y = (self.cell_height - piece_height) // 2
+
+        size = (piece_width, piece_height)
+        self.black = Image.open(black_path).convert("RGBA").resize(size)
+        self.white = Image.open(white_path).convert("RGBA").resize(size)
+
+        # マスを空に戻すための背景の切り抜き
+        self.tiles = [self.background.crop(self.cell_box(i)) for i in range(CELLS)]
+
+    def cell_box(self, index):
+        # 盤面の外周 1 マス分は枠なので +1 する
+        x, y = index_to_xy(index)
+        left = (x + 1) * self.cell_width
+        top = (y + 1) * self.cell_height
+        return left, top, left + self.cell_width, top + self.cell_height
+
+    def cell_origin(self, index):
+        left, top, _, _ = self.cell_box(index)
+        return left + self.offset_x, top + self.offset_y
+
+    def paste_pieces(self, image, bits, piece):
+        for index in iter_bits(bits):
+            image.paste(piece, self.cell_origin(index), piece)
+
+    def repaint(self, image, cells, black, white):
+        """cells に含まれるマスだけを背景に戻してから石を置き直す"""
+        for index in iter_bits(cells):
+            image.paste(self.tiles[index], self.cell_box(index)[:2])
+        self.paste_pieces(image, cells & black, self.black)
+        self.paste_pieces(image, cells & white, self.white)
+
+
+_sprites = None
+_sprites_lock = threading.Lock()
+
+
+def get_sprites():
+    """スプライトを（初回だけ読み込んで）返す"""
+    global _sprites
+    if _sprites is None:
+        with _sprites_lock:
+            if _sprites is None:
+                _sprites = Sprites(GFX_BACKGROUND, GFX_BLACK, GFX_WHITE)
+    return _sprites
+
+
+def board_key(board):
+    """盤面を 1 つの整数にまとめたキャッシュキー"""
+    return (board.black << CELLS) | board.white
+
+
+def encode_image(image):
+    buffer = BytesIO()
+    if IMAGE_FORMAT == "webp":
+        image.save(buffer, format="WEBP", quality=WEBP_QUALITY, lossless=WEBP_LOSSLESS)
+    else:
+        image.save(buffer, format="PNG", compress_level=PNG_COMPRESS_LEVEL)
+    return buffer.getvalue()
+
+
+class RenderCache:
+    """盤面キー → エンコード済みバイト列の LRU キャッシュ"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        # ワーカースレッドからも読み書きされる
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def put(self, key, data):
+        with self.lock:
+            self.entries[key] = data
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+render_cache = RenderCache(RENDER_CACHE_SIZE)
+
+
+class BoardRenderer:
+    """
+    ゲームごとに 1 つ持つ差分描画用の画像。
+    前回描いた盤面との差分（＝直前の手で置いた・裏返ったマス）だけを描き直す。
+    作るのはイベントループ上なので、スプライトを使うのは最初に描くとき（ワーカー上）まで遅らせる。
+    """
+
+    def __init__(self):
+        self.image = None
+        self.black = 0
+        self.white = 0
+
+    def render(self, board):
+        key = board_key(board)
+        data = render_cache.get(key)
+        if data is not None:
+            return data
+
+        sprites = get_sprites()
+        if self.image is None:
+            self.image = sprites.background.copy()
+        changed = (self.black ^ board.black) | (self.white ^ board.white)
+        sprites.repaint(self.image, changed, board.black, board.white)
+        self.black, self.white = board.black, board.white
+
+        data = encode_image(self.image)
+        render_cache.put(key, data)
+        return data
+
+
+def render_board(board, renderer=None):
+    """盤面のエンコード済み画像のバイト列を返す"""
+    if renderer is None:
+        renderer = BoardRenderer()
+    return renderer.render(board)
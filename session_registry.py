@@ -0,0 +1,104 @@
+"""ゲームのセッション管理（放置されたゲームの片付け）
+
+各ゲームはセッションが始まったときと操作があるたびに touch して期限を延ばし、
+終わったら remove する。期限の一番早いものから順にヒープで管理し、
+1 つのタスクが次の期限まで眠って、期限切れのセッションの on_expire を呼ぶ。
+期限を延ばしたときはヒープに新しい項目を積むだけで、古い項目は取り出したときに読み捨てる。
+
+タイムアウト（秒）
+  GAME_LOBBY_TIMEOUT : 対戦相手やじゃんけんの手を待っている間（既定 300）
+  GAME_IDLE_TIMEOUT  : 対局中に誰も操作しない間（既定 1800）
+"""
+
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import Counter
+
+LOBBY_TIMEOUT = float(os.getenv("GAME_LOBBY_TIMEOUT", "300"))
+IDLE_TIMEOUT = float(os.getenv("GAME_IDLE_TIMEOUT", "1800"))
+
+
+class SessionRegistry:
+    def __init__(self):
+        # (種類, キー) → 期限 / 期限切れのときに呼ぶコルーチン関数
+        self.deadlines = {}
+        self.handlers = {}
+        self.heap = []
+        self.order = itertools.count()
+        # 種類ごとの件数
+        self.started = Counter()
+        self.ended = Counter()
+        self.reaped = Counter()
+        self.wake = None
+        self.task = None
+        self.pending = set()  # 実行中の on_expire のタスク
+
+    def touch(self, kind, key, timeout, on_expire):
+        """セッションを登録し、期限を timeout 秒後にする（登録済みなら延ばす）"""
+        entry = (kind, key)
+        if entry not in self.deadlines:
+            self.started[kind] += 1
+        deadline = time.monotonic() + timeout
+        self.deadlines[entry] = deadline
+        self.handlers[entry] = on_expire
+        heapq.heappush(self.heap, (deadline, next(self.order), entry))
+        # 読み捨てる項目がたまりすぎたら作り直す
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(d, next(self.order), e) for e, d in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+        if self.task is None or self.task.done():
+            self.wake = asyncio.Event()
+            self.task = asyncio.create_task(self.run())
+        elif self.heap[0][2] == entry:
+            # 一番早い期限が変わったので眠り直してもらう
+            self.wake.set()
+
+    def remove(self, kind, key):
+        """セッションが終わった（期限切れで片付けられた後なら何もしない）"""
+        entry = (kind, key)
+        if self.deadlines.pop(entry, None) is not None:
+            del self.handlers[entry]
+            self.ended[kind] += 1
+
+    def expire_due(self):
+        now = time.monotonic()
+        while self.heap and self.heap[0][0] <= now:
+            deadline, _, entry = heapq.heappop(self.heap)
+            if self.deadlines.get(entry) != deadline:
+                continue  # 期限が延びたか、もう終わっている
+            del self.deadlines[entry]
+            on_expire = self.handlers.pop(entry)
+            kind, key = entry
+            self.reaped[kind] += 1
+            print(f"[sessions] {kind} {key} は操作がないため終了します")
+            task = asyncio.create_task(on_expire(key))
+            self.pending.add(task)
+            task.add_done_callback(self.expire_done)
+
+    def expire_done(self, task):
+        self.pending.discard(task)
+        if not task.cancelled() and task.exception():
+            print(f"[sessions] 期限切れの処理でエラーが発生しました: {task.exception()!r}")
+
+    async def run(self):
+        while True:
+            self.expire_due()
+            timeout = self.heap[0][0] - time.monotonic() if self.heap else None
+            self.wake.clear()
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    def stats(self):
+        """{種類: (進行中, 開始, 終了, 期限切れ)}"""
+        live = Counter(kind for kind, _ in self.deadlines)
+        kinds = sorted(set(self.started) | set(live))
+        return {kind: (live[kind], self.started[kind], self.ended[kind], self.reaped[kind]) for kind in kinds}
+
+
+sessions = SessionRegistry()
@@ -0,0 +1,130 @@
+"""シャードを複数プロセスに分けて起動・監視するスーパーバイザー
+
+全体のシャード数 --shards を --workers 個のプロセスに均等に割り振り、
+それぞれ game_host.py --shard-count N --shard-ids ... として起動する。
+ワーカーは正常な間だけ生存確認ファイルを書き換えるので、
+プロセスが落ちたときや、ファイルが --stale 秒以上更新されないときは再起動する。
+
+    python shard_supervisor.py --shards 8 --workers 4
+"""
+
+import argparse
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+HOST_SCRIPT = str(Path(__file__).resolve().parent / "game_host.py")
+
+# 再起動の待ち時間の上限（秒）。連続で落ちるたびに倍にしていく
+MAX_BACKOFF = 60
+
+
+def split_shards(shard_count, workers):
+    """[[0, 4], [1, 5], ...] のようにシャード番号を各ワーカーへ振り分ける"""
+    return [list(range(i, shard_count, workers)) for i in range(min(workers, shard_count))]
+
+
+class ShardWorker:
+    def __init__(self, index, shard_ids, shard_count, heartbeat_dir):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.heartbeat = Path(heartbeat_dir) / f"shard-worker-{index}.heartbeat"
+        self.process = None
+        self.started_at = 0.0
+        self.backoff = 1
+        self.restart_at = 0.0
+
+    def start(self):
+        self.heartbeat.unlink(missing_ok=True)
+        command = [
+            sys.executable, HOST_SCRIPT,
+            "--shard-count", str(self.shard_count),
+            "--shard-ids", *map(str, self.shard_ids),
+            "--heartbeat", str(self.heartbeat),
+        ]
+        print(f"[supervisor] ワーカー {self.index}（シャード {self.shard_ids}）を起動します")
+        self.process = subprocess.Popen(command)
+        self.started_at = time.time()
+
+    def stop(self):
+        if self.process and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+        self.process = None
+
+    def last_beat(self):
+        try:
+            return float(self.heartbeat.read_text())
+        except (OSError, ValueError):
+            return None
+
+    def problem(self, stale, grace):
+        """異常があれば理由を返す（正常なら None）"""
+        code = self.process.poll()
+        if code is not None:
+            return f"終了コード {code} で終了しました"
+        now = time.time()
+        beat = self.last_beat()
+        if beat is None:
+            if now - self.started_at > grace:
+                return f"起動から {grace} 秒たってもつながりません"
+        elif now - beat > stale:
+            return f"{now - beat:.0f} 秒間応答がありません"
+        return None
+
+    def check(self, stale, grace):
+        """死活を確かめ、必要なら待ち時間を置いて再起動する"""
+        now = time.time()
+        if self.process is None:
+            if now >= self.restart_at:
+                self.start()
+            return
+        reason = self.problem(stale, grace)
+        if reason is None:
+            # 起動後に生存確認が届いたら（つながったら）待ち時間を戻す
+            beat = self.last_beat()
+            if beat is not None and beat >= self.started_at:
+                self.backoff = 1
+            return
+        print(f"[supervisor] ワーカー {self.index}: {reason}。{self.backoff} 秒後に再起動します")
+        self.stop()
+        self.restart_at = now + self.backoff
+        self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="シャードごとに Bot のプロセスを起動して監視します")
+    parser.add_argument("--shards", type=int, required=True, help="全体のシャード数")
+    parser.add_argument("--workers", type=int, default=1, help="起動するプロセス数")
+    parser.add_argument("--interval", type=float, default=5, help="死活確認の間隔（秒）")
+    parser.add_argument("--stale", type=float, default=60, help="生存確認がこの秒数途絶えたら再起動")
+    parser.add_argument("--grace", type=float, default=120, help="起動直後に接続を待つ秒数")
+    parser.add_argument("--heartbeat-dir", default=tempfile.gettempdir(), help="生存確認ファイルの置き場所")
+    args = parser.parse_args()
+
+    workers = [
+        ShardWorker(index, shard_ids, args.shards, args.heartbeat_dir)
+        for index, shard_ids in enumerate(split_shards(args.shards, args.workers))
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        while True:
+            time.sleep(args.interval)
+            for worker in workers:
+                worker.check(args.stale, args.grace)
+    except KeyboardInterrupt:
+        print("[supervisor] すべてのワーカーを停止します...")
+    finally:
+        for worker in workers:
+            worker.stop()
+
+
+if __name__ == "__main__":
+    main()
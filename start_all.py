@@ -1,20 +1,33 @@
 import subprocess
+import sys
 
-# 起動するスクリプトのリスト
+import game_host
+
+# 起動するスクリプトのリスト（--separate のときだけ使う）
 scripts = ["hit_and_blow.py", "janken_bot.py", "jankenhoitour_bot.py", "connect4_bot.py", "osero.py"]
 
-# 各スクリプトを並列で起動
-processes = []
-try:
-    for script in scripts:
-        print(f"Starting {script}...")
-        process = subprocess.Popen(["python", script])
-        processes.append(process)
 
-    # 全てのプロセスが終了するのを待機
-    for process in processes:
-        process.wait()
-except KeyboardInterrupt:
-    print("Shutting down all scripts...")
-    for process in processes:
-        process.terminate()
\ No newline at end of file
+def start_separately():
+    """以前のように、ゲームごとに別プロセスの Bot として起動する"""
+    processes = []
+    try:
+        for script in scripts:
+            print(f"Starting {script}...")
+            process = subprocess.Popen([sys.executable, script])
+            processes.append(process)
+
+        # 全てのプロセスが終了するのを待機
+        for process in processes:
+            process.wait()
+    except KeyboardInterrupt:
+        print("Shutting down all scripts...")
+        for process in processes:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    if "--separate" in sys.argv[1:]:
+        start_separately()
+    else:
+        # 通常は 1 プロセス・1 接続で全ゲームを動かす
+        game_host.main([])
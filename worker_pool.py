@@ -0,0 +1,60 @@
+"""重い同期処理（画像生成など）をイベントループの外で実行するワーカープール
+
+同時に受け付ける処理の数に上限を設け、上限に達したら呼び出し側を await で待たせる
+（イベントループ自体は止めない）。
+
+環境変数（RENDER の部分はプール名。SEARCH も同様）:
+  RENDER_POOL_KIND    : thread / process
+  RENDER_POOL_WORKERS : ワーカー数
+  RENDER_POOL_QUEUE   : 実行中＋待機中の処理数の上限
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+
+class WorkerPool:
+    def __init__(self, kind="thread", max_workers=None, max_pending=None):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"kind は thread か process を指定してください: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending or self.max_workers * 4
+        if kind == "process":
+            self.executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._slots = asyncio.Semaphore(self.max_pending)
+
+    @classmethod
+    def from_env(cls, name, kind="thread"):
+        prefix = f"{name.upper()}_POOL_"
+        workers = os.getenv(prefix + "WORKERS")
+        pending = os.getenv(prefix + "QUEUE")
+        return cls(
+            kind=os.getenv(prefix + "KIND", kind),
+            max_workers=int(workers) if workers else None,
+            max_pending=int(pending) if pending else None,
+        )
+
+    @property
+    def uses_processes(self):
+        return self.kind == "process"
+
+    async def run(self, func, *args, **kwargs):
+        """func(*args, **kwargs) をワーカーで実行して結果を返す"""
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self.executor, functools.partial(func, *args, **kwargs)
+            )
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+render_pool = WorkerPool.from_env("render")
+# 探索は CPU を使い切るので、既定で別プロセスに逃がして GIL を奪わないようにする
+search_pool = WorkerPool.from_env("search", kind="process")